@@ -0,0 +1,138 @@
+import os, sys, json, signal, threading, importlib
+
+# Chế độ all-in-one: chạy cả 4 service trong một process, sau một WSGI dispatcher.
+# Các lời gọi giữa service (xác thực token, tra cứu/trừ số lượng sách, hoàn kho)
+# đi thẳng vào hàm của service kia thay vì HTTP, và không cần Consul/nginx.
+os.environ["CONSUL_ENABLED"] = "false"
+os.environ.setdefault("TRUST_GATEWAY_HEADERS", "false")
+
+from werkzeug.serving import run_simple
+from werkzeug.wrappers import Response
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ALL_IN_ONE_HOST = os.environ.get("ALL_IN_ONE_HOST", "0.0.0.0")
+ALL_IN_ONE_PORT = int(os.environ.get("ALL_IN_ONE_PORT", 8080))
+DRAIN_GRACE_SECONDS = float(os.environ.get("DRAIN_GRACE_SECONDS", 15))
+
+# Segment đầu của đường dẫn -> service xử lý ("" là trang chủ / đăng nhập).
+# /books/... là API nội bộ giữa các service (không cần đăng nhập) nên không được
+# mở ra ngoài; ở chế độ này borrow_service gọi thẳng hàm của book_service.
+ROUTES = {
+    "": "auth", "auth": "auth", "admin": "auth", "admin-api": "auth",
+    "user": "user", "user-api": "user",
+    "book": "book", "book-api": "book", "book-user": "book",
+    "borrow": "borrow", "borrow-api": "borrow", "borrow-admin": "borrow", "metrics": "borrow",
+}
+
+# Import một service từ thư mục riêng của nó. Các service dùng chung tên module
+# (app, config, database, health, models...) nên sau khi import xong phải gỡ
+# chúng khỏi sys.modules để service sau nạp bản của chính nó.
+def load_service(name, *extra):
+    path = os.path.join(ROOT, f"{name}_service")
+    sys.path.insert(0, path)
+    try:
+        modules = {m: importlib.import_module(m) for m in ("app", "health") + extra}
+    finally:
+        sys.path.remove(path)
+        for key, mod in list(sys.modules.items()):
+            # models là namespace package (không có __init__.py) nên xét cả __path__
+            locations = [getattr(mod, "__file__", None) or ""] + list(getattr(mod, "__path__", []))
+            if any(loc == path or loc.startswith(path + os.sep) for loc in locations):
+                del sys.modules[key]
+    return modules
+
+# Xác thực token bằng hàm của Auth Service trong cùng process
+class LocalAuthClient:
+    def __init__(self, auth_app):
+        self.auth_app = auth_app
+
+    def verify(self, token):
+        with self.auth_app.app.app_context():
+            return self.auth_app.verify_access_token(token)
+
+# Tra cứu và cập nhật số lượng sách bằng hàm của Book Service trong cùng process.
+# Giữ nguyên giao diện (body, status) của bản HTTP.
+class LocalBookClient:
+    def __init__(self, book_model):
+        self.book_model = book_model
+
+    def get_book(self, book_id, fields=None):
+        try:
+            projection = self.book_model.book_projection(fields)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        book = self.book_model.find_book_by_id(book_id, projection)
+        if not book:
+            return {"error": "Không tìm thấy sách"}, 404
+        return book, 200
+
+    def decrease(self, book_id, quantity):
+        updated = self.book_model.decrease_quantity(book_id, quantity)
+        if updated is None:
+            return {"error": "Không tìm thấy sách"}, 404
+        if not updated:
+            return {"error": "Số lượng sách không đủ"}, 400
+        return {"message": "Cập nhật số lượng thành công"}, 200
+
+    def restock(self, batch_id, items):
+        self.book_model.restock_books(items, batch_id)
+        return True
+
+def json_response(body, status):
+    return Response(json.dumps(body, ensure_ascii=False), status=status, mimetype="application/json")
+
+# Gộp health của cả 4 service: chỉ UP/ready khi tất cả đều UP/ready
+def aggregate_health(services, probe):
+    results = {name: probe(mods["health"]) for name, mods in services.items()}
+    ok = all(status == 200 for _, status in results.values())
+    body = {"status": "UP" if ok else "DOWN", "services": {name: b for name, (b, _) in results.items()}}
+    return json_response(body, 200 if ok else 503)
+
+# WSGI dispatcher: chọn app theo segment đầu của đường dẫn
+def make_dispatcher(services):
+    apps = {name: mods["app"].app for name, mods in services.items()}
+
+    def dispatch(environ, start_response):
+        path = environ.get("PATH_INFO", "/")
+        if path in ("/health", "/health/live"):
+            return aggregate_health(services, lambda h: h.liveness())(environ, start_response)
+        if path == "/health/ready":
+            return aggregate_health(services, lambda h: h.readiness())(environ, start_response)
+        target = ROUTES.get(path.lstrip("/").split("/", 1)[0])
+        if target is None:
+            return json_response({"error": "Not found"}, 404)(environ, start_response)
+        return apps[target](environ, start_response)
+
+    return dispatch
+
+# Bắt SIGTERM cho cả process: cả 4 service cùng chuyển sang draining rồi mới tắt
+def install_drain_handler(services):
+    def handle_sigterm(signum, frame):
+        for mods in services.values():
+            mods["health"].start_draining()
+        print(f"[ALL-IN-ONE] Draining, shutting down in {DRAIN_GRACE_SECONDS}s")
+        threading.Timer(DRAIN_GRACE_SECONDS, lambda: os.kill(os.getpid(), signal.SIGINT)).start()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+def build():
+    services = {
+        "auth": load_service("auth"),
+        "user": load_service("user", "clients"),
+        "book": load_service("book", "clients", "models.book_model"),
+        "borrow": load_service("borrow", "clients"),
+    }
+    auth_client = LocalAuthClient(services["auth"]["app"])
+    book_client = LocalBookClient(services["book"]["models.book_model"])
+    services["user"]["clients"].use(auth=auth_client)
+    services["book"]["clients"].use(auth=auth_client)
+    services["borrow"]["clients"].use(auth=auth_client, book=book_client)
+
+    for mods in services.values():
+        mods["app"].start_background_tasks()
+    install_drain_handler(services)
+    return make_dispatcher(services)
+
+if __name__ == "__main__":
+    application = build()
+    print(f"[ALL-IN-ONE] Serving auth, user, book, borrow on {ALL_IN_ONE_HOST}:{ALL_IN_ONE_PORT}")
+    run_simple(ALL_IN_ONE_HOST, ALL_IN_ONE_PORT, application, threaded=True)
@@ -1,11 +1,16 @@
 from flask import Flask, render_template, request, jsonify
 from flask_jwt_extended import (
-    JWTManager, create_access_token,
+    JWTManager, create_access_token, decode_token,
     jwt_required, get_jwt, verify_jwt_in_request
 )
-from datetime import timedelta
-from models.user_model import create_user, find_user, update_token, check_password
+from datetime import datetime, timedelta
+from models.user_model import create_user, find_user, update_token, check_password, ensure_user_indexes
+from models.token_model import ensure_token_indexes, issue_refresh_token, rotate_refresh_token, revoke_refresh_token
+from revocation import ensure_revocation_indexes, revocation_cache, revoke_token, revocation_check, start_revocation_sync
+from database import client as mongo_client
 from service_registry import register_service
+from rate_limit import limit_writes, ensure_rate_limit_indexes
+from health import add_check, mongo_check, start_health_monitor, install_drain_handler, mark_ready, liveness, readiness
 from config import *
 
 app = Flask(__name__)
@@ -17,13 +22,32 @@ app.config["JWT_HEADER_NAME"] = "Authorization"
 app.config["JWT_HEADER_TYPE"] = "Bearer"
 jwt_manager = JWTManager(app)
 
-# Kiểm tra service có hoạt động không
+# Từ chối token đã bị thu hồi (tra cứu trong bộ nhớ, không gọi database)
+@jwt_manager.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return revocation_cache.is_revoked(jwt_payload["jti"])
+
+# Kiểm tra service có hoạt động không (liveness)
 @app.route("/health")
+@app.route("/health/live")
 def health():
-    return jsonify({"status": "UP"}), 200
+    body, status = liveness()
+    return jsonify(body), status
+
+# Kiểm tra service đã sẵn sàng nhận request chưa (đọc trạng thái đã cache)
+@app.route("/health/ready")
+def health_ready():
+    body, status = readiness()
+    return jsonify(body), status
+
+# Khóa giới hạn tần suất cho đăng nhập/đăng ký: username gửi lên
+def submitted_username():
+    data = request.get_json(silent=True) if request.is_json else request.form
+    return (data or {}).get("username")
 
 # Xử lý đăng ký tài khoản mới
 @app.route("/auth/register", methods=["GET", "POST"])
+@limit_writes(identity=submitted_username)
 def register_page():
     if request.method == "GET":
         return render_template("register.html")
@@ -53,6 +77,7 @@ def register_page():
 
 # Xử lý đăng nhập và tạo JWT token
 @app.route("/auth/login", methods=["GET", "POST"])
+@limit_writes(identity=submitted_username)
 def login_page():
     if request.method == "GET":
         return render_template("login.html")
@@ -68,15 +93,38 @@ def login_page():
     if not user or not check_password(password, user["password"]):
         return jsonify({"error": "invalid credentials"}), 401
 
+    return jsonify(issue_tokens(user)), 200
+
+# Cấp access token (ngắn hạn) và refresh token (dài hạn) cho user
+def issue_tokens(user, refresh_token=None):
+    username = user["username"]
     identity = {"username": username, "role": user.get("role", "user")}
-    token = create_access_token(identity=identity, expires_delta=timedelta(hours=1))
+    token = create_access_token(identity=identity, expires_delta=timedelta(minutes=ACCESS_TOKEN_MINUTES))
     update_token(username, token)
 
-    return jsonify({
+    return {
         "token": token,
+        "refresh_token": refresh_token or issue_refresh_token(username),
+        "expires_in": ACCESS_TOKEN_MINUTES * 60,
         "username": username,
         "role": identity["role"]
-    }), 200
+    }
+
+# Cấp access token mới bằng refresh token (không kiểm tra mật khẩu, không chạy bcrypt)
+@app.route("/auth/refresh", methods=["POST"])
+@limit_writes()
+def refresh_token():
+    data = request.get_json(silent=True) or {}
+    token = data.get("refresh_token")
+    if not token:
+        return jsonify({"error": "missing refresh token"}), 400
+
+    username, new_refresh_token = rotate_refresh_token(token)
+    user = find_user(username) if username else None
+    if not user:
+        return jsonify({"error": "invalid refresh token"}), 401
+
+    return jsonify(issue_tokens(user, refresh_token=new_refresh_token)), 200
 
 # Hiển thị trang dashboard admin
 @app.route("/admin")
@@ -98,6 +146,16 @@ def admin_api():
         "message": "Welcome to Admin API"
     }), 200
 
+# Xác thực một access token không qua request HTTP (dùng ở chế độ all-in-one)
+def verify_access_token(token):
+    try:
+        claims = decode_token(token)
+    except Exception:
+        return {"valid": False}
+    if revocation_cache.is_revoked(claims["jti"]):
+        return {"valid": False}
+    return {"valid": True, "sub": claims.get("sub") or {}}
+
 # Xác thực token có hợp lệ không
 @app.route("/auth/verify", methods=["GET", "POST"])
 def verify_token():
@@ -109,9 +167,33 @@ def verify_token():
     except Exception:
         return jsonify({"valid": False}), 401
 
-# Xử lý đăng xuất
-@app.route("/auth/logout")
+# Xác thực token cho API gateway (nginx auth_request): không trả body,
+# danh tính được trả về qua header để gateway chuyển tiếp cho backend
+@app.route("/auth/introspect", methods=["GET", "HEAD"])
+def introspect_token():
+    try:
+        verify_jwt_in_request()
+    except Exception:
+        return ("", 401)
+    sub = get_jwt().get("sub") or {}
+    return ("", 200, {
+        "X-Auth-User": sub.get("username", ""),
+        "X-Auth-Role": sub.get("role", "")
+    })
+
+# Xử lý đăng xuất: thu hồi access token hiện tại và refresh token (nếu gửi kèm)
+@app.route("/auth/logout", methods=["GET", "POST"])
 def logout():
+    try:
+        verify_jwt_in_request()
+        claims = get_jwt()
+        revoke_token(claims["jti"], datetime.utcfromtimestamp(claims["exp"]))
+    except Exception:
+        pass
+
+    data = request.get_json(silent=True) or {}
+    if data.get("refresh_token"):
+        revoke_refresh_token(data["refresh_token"])
     return ("", 204)
 
 # Trang chủ chuyển đến login
@@ -119,7 +201,23 @@ def logout():
 def home():
     return render_template("login.html")
 
+# Khởi động các tác vụ nền của service
+def start_background_tasks():
+    ensure_rate_limit_indexes()
+    ensure_user_indexes()
+    ensure_token_indexes()
+    ensure_revocation_indexes()
+    start_revocation_sync()
+    add_check("mongo", mongo_check(mongo_client))
+    add_check("revocation", revocation_check)
+    start_health_monitor()
+    install_drain_handler()
+    mark_ready()
+
 # Khởi chạy ứng dụng
 if __name__ == "__main__":
     register_service()
-    app.run(port=SERVICE_PORT, debug=True)
\ No newline at end of file
+    start_background_tasks()
+    # Tắt reloader: process cha của reloader sẽ chạy background task lần thứ hai
+    # và ghi đè handler SIGTERM (bỏ qua bước draining)
+    app.run(host=SERVICE_HOST, port=SERVICE_PORT, debug=True, use_reloader=False)
\ No newline at end of file
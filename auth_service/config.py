@@ -3,6 +3,56 @@ import os
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/user_db")
 SERVICE_NAME = os.environ.get("SERVICE_NAME", "auth-service")
 SERVICE_PORT = int(os.environ.get("SERVICE_PORT", 5000))
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "0.0.0.0")
+# Địa chỉ đăng ký lên Consul (mặc định: IP của container)
+SERVICE_ADDRESS = os.environ.get("SERVICE_ADDRESS", "")
 JWT_SECRET = os.environ.get("JWT_SECRET", "mysecretkey")
+ACCESS_TOKEN_MINUTES = int(os.environ.get("ACCESS_TOKEN_MINUTES", 60))
+REFRESH_TOKEN_DAYS = int(os.environ.get("REFRESH_TOKEN_DAYS", 30))
+# Refresh token vừa đổi mà bị gửi lại trong khoảng này (nhiều tab cùng refresh)
+# không bị coi là bị đánh cắp
+REFRESH_REUSE_GRACE_SECONDS = float(os.environ.get("REFRESH_REUSE_GRACE_SECONDS", 30))
 CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
 CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
+# Tắt Consul khi chạy không cần service discovery (ví dụ chế độ all-in-one)
+CONSUL_ENABLED = os.environ.get("CONSUL_ENABLED", "true").lower() == "true"
+# Consul tự gỡ instance có check lỗi liên tục quá lâu (instance đã mất mà không
+# kịp deregister); đủ dài để không gỡ nhầm khi dependency chỉ tạm ngừng
+CONSUL_DEREGISTER_AFTER = os.environ.get("CONSUL_DEREGISTER_AFTER", "30m")
+
+# ---------------- THU HỒI TOKEN ----------------
+REVOCATION_SYNC_INTERVAL = float(os.environ.get("REVOCATION_SYNC_INTERVAL", 2))
+REVOCATION_SYNC_OVERLAP_SECONDS = float(os.environ.get("REVOCATION_SYNC_OVERLAP_SECONDS", 5))
+REVOCATION_BLOOM_CAPACITY = int(os.environ.get("REVOCATION_BLOOM_CAPACITY", 100000))
+REVOCATION_BLOOM_ERROR_RATE = float(os.environ.get("REVOCATION_BLOOM_ERROR_RATE", 0.001))
+
+# ---------------- GIỚI HẠN TẢI (ENDPOINT GHI) ----------------
+# memory: mỗi process tự giới hạn | mongo: dùng chung giữa các replica
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", 5))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", 30))
+RATE_LIMIT_IDENTITY_RATE = float(os.environ.get("RATE_LIMIT_IDENTITY_RATE", 1))
+RATE_LIMIT_IDENTITY_BURST = float(os.environ.get("RATE_LIMIT_IDENTITY_BURST", 5))
+# Tin header X-Real-IP do API gateway gắn vào
+TRUST_X_REAL_IP = os.environ.get("TRUST_X_REAL_IP", "false").lower() == "true"
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", 16))
+MAX_QUEUE_DEPTH = int(os.environ.get("MAX_QUEUE_DEPTH", 32))
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get("QUEUE_TIMEOUT_SECONDS", 2))
+SHED_RETRY_AFTER_SECONDS = float(os.environ.get("SHED_RETRY_AFTER_SECONDS", 1))
+
+# ---------------- MONGODB ----------------
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 10000))
+# Nén dữ liệu giữa service và MongoDB, ví dụ "zstd,snappy,zlib" (zlib không cần cài thêm)
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "zlib")
+# Cho phép endpoint danh sách đọc từ secondary trên replica set
+MONGO_READ_SECONDARY_PREFERRED = os.environ.get("MONGO_READ_SECONDARY_PREFERRED", "false").lower() == "true"
+
+# ---------------- HEALTH CHECK ----------------
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", 5))
+MONGO_PING_MAX_MS = float(os.environ.get("MONGO_PING_MAX_MS", 500))
+DRAIN_GRACE_SECONDS = float(os.environ.get("DRAIN_GRACE_SECONDS", 15))
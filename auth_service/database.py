@@ -0,0 +1,26 @@
+from pymongo import MongoClient, ReadPreference
+from config import (
+    MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_COMPRESSORS, MONGO_READ_SECONDARY_PREFERRED
+)
+
+# Một MongoClient duy nhất cho cả process (thread-safe, dùng chung connection pool)
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    compressors=MONGO_COMPRESSORS or None
+)
+db = client["userdb"]
+
+# Collection dùng cho các endpoint chỉ đọc nặng: đọc từ secondary (nếu bật)
+# để phân tải đọc trên replica set, ghi vẫn luôn vào primary
+def for_reads(collection):
+    if MONGO_READ_SECONDARY_PREFERRED:
+        return collection.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    return collection
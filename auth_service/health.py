@@ -0,0 +1,93 @@
+import threading, time, signal, os
+from datetime import datetime
+from config import HEALTH_CHECK_INTERVAL, MONGO_PING_MAX_MS, DRAIN_GRACE_SECONDS
+
+# Trạng thái sẵn sàng được cache lại để /health/ready chỉ đọc bộ nhớ (O(1))
+_checks = {}
+_lock = threading.Lock()
+_state = {
+    "phase": "warming",  # warming -> ready -> draining
+    "checks": {},
+    "checked_at": None
+}
+
+# Đăng ký một hàm kiểm tra phụ thuộc, hàm trả về (ok, chi_tiết)
+def add_check(name, fn):
+    _checks[name] = fn
+
+# Tạo hàm kiểm tra MongoDB: ping và đo độ trễ
+def mongo_check(client):
+    def check():
+        started = time.perf_counter()
+        client.admin.command("ping")
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        return latency_ms <= MONGO_PING_MAX_MS, {"latency_ms": latency_ms}
+    return check
+
+# Chạy toàn bộ các hàm kiểm tra và cập nhật trạng thái cache
+def run_checks():
+    results = {}
+    for name, fn in list(_checks.items()):
+        try:
+            ok, detail = fn()
+        except Exception as e:
+            ok, detail = False, {"error": str(e)}
+        results[name] = {"ok": bool(ok), **(detail or {})}
+    with _lock:
+        _state["checks"] = results
+        _state["checked_at"] = datetime.utcnow().isoformat()
+    return results
+
+# Vòng lặp nền kiểm tra định kỳ
+def _monitor_loop():
+    while True:
+        run_checks()
+        time.sleep(HEALTH_CHECK_INTERVAL)
+
+# Khởi động luồng kiểm tra sức khoẻ chạy nền
+def start_health_monitor():
+    t = threading.Thread(target=_monitor_loop, name="health-monitor", daemon=True)
+    t.start()
+    return t
+
+# Đánh dấu service đã khởi động xong (cache đã nạp)
+def mark_ready():
+    with _lock:
+        if _state["phase"] == "warming":
+            _state["phase"] = "ready"
+
+# Chuyển sang trạng thái draining (sắp tắt, ngừng nhận request mới)
+def start_draining():
+    with _lock:
+        _state["phase"] = "draining"
+
+# Bắt SIGTERM: báo not-ready để Consul/nginx ngừng định tuyến, chờ rồi mới tắt
+def install_drain_handler():
+    def handle_sigterm(signum, frame):
+        start_draining()
+        print(f"[HEALTH] Draining, shutting down in {DRAIN_GRACE_SECONDS}s")
+        threading.Timer(DRAIN_GRACE_SECONDS, lambda: os.kill(os.getpid(), signal.SIGINT)).start()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+# Liveness: process còn sống là UP, không phụ thuộc bên ngoài
+def liveness():
+    return {"status": "UP"}, 200
+
+# Readiness: đọc kết quả đã cache, không gọi ra ngoài
+def readiness():
+    with _lock:
+        phase = _state["phase"]
+        checks = dict(_state["checks"])
+        checked_at = _state["checked_at"]
+    ready = (
+        phase == "ready"
+        and checked_at is not None
+        and all(c["ok"] for c in checks.values())
+    )
+    body = {
+        "status": "UP" if ready else "DOWN",
+        "phase": phase,
+        "checks": checks,
+        "checked_at": checked_at
+    }
+    return body, (200 if ready else 503)
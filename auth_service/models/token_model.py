@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from database import db
+import secrets, hashlib
+from config import REFRESH_TOKEN_DAYS, REFRESH_REUSE_GRACE_SECONDS
+
+# Refresh token: chỉ lưu hash, mỗi lần dùng sẽ được đổi sang token mới (rotation).
+# Các token sinh ra từ cùng một lần đăng nhập thuộc cùng một "family".
+refresh_tokens = db["refresh_tokens"]
+
+# Tạo index cho refresh token (gọi khi service khởi động)
+def ensure_token_indexes():
+    refresh_tokens.create_index("token_hash", unique=True)
+    refresh_tokens.create_index("family_id")
+    refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+# Tạo refresh token mới cho user
+def issue_refresh_token(username, family_id=None):
+    """Tạo refresh token mới (trả về token gốc, DB chỉ lưu hash)"""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    refresh_tokens.insert_one({
+        "token_hash": _hash_token(token),
+        "family_id": family_id or secrets.token_hex(16),
+        "username": username,
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_DAYS),
+        "used_at": None,
+        "revoked": False
+    })
+    return token
+
+# Đổi refresh token cũ lấy token mới. Token vừa được dùng trong vòng
+# REFRESH_REUSE_GRACE_SECONDS (ví dụ hai tab cùng refresh lúc token hết hạn) được
+# cấp thêm một token cùng family; gửi lại sau khoảng đó (có thể bị lộ) thì thu hồi
+# toàn bộ family để buộc đăng nhập lại.
+def rotate_refresh_token(token):
+    """Trả về (username, refresh token mới) hoặc (None, None) nếu không hợp lệ"""
+    token_hash = _hash_token(token)
+    now = datetime.utcnow()
+    doc = refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used_at": None, "revoked": False, "expires_at": {"$gt": now}},
+        {"$set": {"used_at": now}}
+    )
+    if doc:
+        return doc["username"], issue_refresh_token(doc["username"], doc["family_id"])
+
+    reused = refresh_tokens.find_one({"token_hash": token_hash, "used_at": {"$ne": None}})
+    if not reused:
+        return None, None
+    in_grace = reused["used_at"] >= now - timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS)
+    if in_grace and not reused["revoked"] and reused["expires_at"] > now:
+        return reused["username"], issue_refresh_token(reused["username"], reused["family_id"])
+    revoke_family(reused["family_id"])
+    return None, None
+
+# Thu hồi toàn bộ refresh token cùng family
+def revoke_family(family_id):
+    """Thu hồi các refresh token cùng family"""
+    refresh_tokens.update_many({"family_id": family_id}, {"$set": {"revoked": True}})
+
+# Thu hồi refresh token (khi đăng xuất)
+def revoke_refresh_token(token):
+    """Thu hồi refresh token và các token cùng family"""
+    doc = refresh_tokens.find_one({"token_hash": _hash_token(token)})
+    if doc:
+        revoke_family(doc["family_id"])
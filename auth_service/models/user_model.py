@@ -1,13 +1,14 @@
-from pymongo import MongoClient
 from datetime import datetime
-from config import MONGO_URI
+from database import db
 import bcrypt
 
 # Kết nối MongoDB
-client = MongoClient(MONGO_URI)
-db = client["userdb"]
 users = db["users"]
 
+# Tạo index cho users (gọi khi service khởi động)
+def ensure_user_indexes():
+    users.create_index("username")
+
 # ---------------------- HÀM BCRYPT ----------------------
 
 # Mã hóa mật khẩu thành chuỗi hash để lưu vào database
@@ -0,0 +1,124 @@
+import threading, time, hashlib, math
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from database import db
+from config import (
+    REVOCATION_SYNC_INTERVAL, REVOCATION_SYNC_OVERLAP_SECONDS,
+    REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE
+)
+
+# Access token đã bị thu hồi (theo jti), tự xóa khi token hết hạn
+revoked_tokens = db["revoked_tokens"]
+
+# Tạo index (gọi khi service khởi động)
+def ensure_revocation_indexes():
+    revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+    revoked_tokens.create_index("revoked_at")
+
+# Bloom filter: trả lời "chắc chắn chưa bị thu hồi" mà không cần tra cứu thêm
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for p in self._positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+# Danh sách thu hồi trong bộ nhớ của mỗi process: Bloom filter + tập chính xác,
+# đồng bộ dần từ MongoDB (chỉ đọc các bản ghi mới kể từ lần đồng bộ trước)
+class RevocationCache:
+    def __init__(self):
+        self._bloom = BloomFilter(REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE)
+        self._exact = {}  # jti -> expires_at
+        self._lock = threading.Lock()
+        self._watermark = None
+        self.synced_at = None
+
+    # Kiểm tra token bị thu hồi chưa (không truy vấn database)
+    def is_revoked(self, jti):
+        if jti not in self._bloom:
+            return False
+        expires_at = self._exact.get(jti)
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._exact[jti] = expires_at
+            self._bloom.add(jti)
+
+    # Đọc các jti mới bị thu hồi; đọc lùi lại một khoảng nhỏ để không bỏ sót
+    # bản ghi ghi trễ hoặc lệch giờ giữa các replica
+    def sync(self):
+        query = {}
+        if self._watermark:
+            query = {"revoked_at": {"$gte": self._watermark - timedelta(seconds=REVOCATION_SYNC_OVERLAP_SECONDS)}}
+        watermark = self._watermark
+        for doc in revoked_tokens.find(query, {"expires_at": 1, "revoked_at": 1}):
+            self.add(doc["_id"], doc["expires_at"])
+            if watermark is None or doc["revoked_at"] > watermark:
+                watermark = doc["revoked_at"]
+        self._watermark = watermark
+        self._prune()
+        self.synced_at = time.monotonic()
+
+    # Bỏ các jti đã hết hạn; dựng lại Bloom filter khi tập chính xác đã thu nhỏ
+    def _prune(self):
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [jti for jti, exp in self._exact.items() if exp <= now]
+            if len(expired) < max(1, len(self._exact) // 2):
+                return
+            for jti in expired:
+                del self._exact[jti]
+            bloom = BloomFilter(max(REVOCATION_BLOOM_CAPACITY, len(self._exact) * 2), REVOCATION_BLOOM_ERROR_RATE)
+            for jti in self._exact:
+                bloom.add(jti)
+            self._bloom = bloom
+
+revocation_cache = RevocationCache()
+
+# Thu hồi access token theo jti cho tới khi token hết hạn
+def revoke_token(jti, expires_at):
+    now = datetime.utcnow()
+    try:
+        revoked_tokens.insert_one({"_id": jti, "expires_at": expires_at, "revoked_at": now})
+    except DuplicateKeyError:
+        pass
+    revocation_cache.add(jti, expires_at)
+
+# Health check: danh sách thu hồi đã được đồng bộ gần đây
+def revocation_check():
+    synced_at = revocation_cache.synced_at
+    if synced_at is None:
+        return False, {"synced": False}
+    age = round(time.monotonic() - synced_at, 1)
+    return age <= REVOCATION_SYNC_INTERVAL * 3, {"sync_age_s": age}
+
+def _sync_loop():
+    while True:
+        time.sleep(REVOCATION_SYNC_INTERVAL)
+        try:
+            revocation_cache.sync()
+        except Exception as e:
+            print(f"[REVOCATION] Sync failed: {e}")
+
+# Nạp danh sách thu hồi lần đầu rồi đồng bộ định kỳ chạy nền
+def start_revocation_sync():
+    try:
+        revocation_cache.sync()
+    except Exception as e:
+        print(f"[REVOCATION] Initial sync failed: {e}")
+    t = threading.Thread(target=_sync_loop, name="revocation-sync", daemon=True)
+    t.start()
+    return t
@@ -1,12 +1,38 @@
-import consul
-from config import SERVICE_NAME, SERVICE_PORT, CONSUL_HOST, CONSUL_PORT
+import consul, socket, atexit, os
+from config import SERVICE_NAME, SERVICE_PORT, SERVICE_ADDRESS, CONSUL_HOST, CONSUL_PORT, CONSUL_ENABLED, CONSUL_DEREGISTER_AFTER
+
+# ID riêng cho từng instance để nhiều replica cùng tên không ghi đè nhau
+SERVICE_ID = os.environ.get("SERVICE_ID") or f"{SERVICE_NAME}-{socket.gethostname()}-{SERVICE_PORT}"
+
+# Địa chỉ mà các service khác (và Consul) dùng để gọi tới instance này
+def get_advertised_address():
+    if SERVICE_ADDRESS:
+        return SERVICE_ADDRESS
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except socket.error:
+        return "127.0.0.1"
 
 def register_service():
+    if not CONSUL_ENABLED:
+        return
+    address = get_advertised_address()
     c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
     c.agent.service.register(
         SERVICE_NAME,
-        address="localhost",
+        service_id=SERVICE_ID,
+        address=address,
         port=SERVICE_PORT,
-        check=consul.Check.http(f"http://localhost:{SERVICE_PORT}/health", interval="10s")
+        check=consul.Check.http(f"http://{address}:{SERVICE_PORT}/health/ready", interval="10s", deregister=CONSUL_DEREGISTER_AFTER)
     )
-    print(f"[CONSUL] Registered {SERVICE_NAME} on port {SERVICE_PORT}")
+    atexit.register(deregister_service)
+    print(f"[CONSUL] Registered {SERVICE_ID} at {address}:{SERVICE_PORT}")
+
+# Gỡ instance khỏi Consul khi tắt service
+def deregister_service():
+    try:
+        c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
+        c.agent.service.deregister(SERVICE_ID)
+        print(f"[CONSUL] Deregistered {SERVICE_ID}")
+    except Exception as e:
+        print(f"[CONSUL] Deregister failed: {e}")
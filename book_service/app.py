@@ -1,39 +1,35 @@
 from flask import Flask, jsonify, request, render_template
-from service_registry import register_service
+from service_registry import register_service, discovery_check
+import clients
+from gateway import gateway_identity
+from rate_limit import limit_writes, ensure_rate_limit_indexes
+from idempotency import idempotent, ensure_idempotency_indexes
+from health import add_check, mongo_check, start_health_monitor, install_drain_handler, mark_ready, liveness, readiness
 from config import *
 from models.book_model import *
-import requests, consul, os, time
+from database import client as mongo_client
+from models.book_import import import_books
+from pymongo.errors import DuplicateKeyError
 
 app = Flask(__name__)
 app.secret_key = "book_secret"
 
-# Kiểm tra service có hoạt động không
+# Kiểm tra service có hoạt động không (liveness)
 @app.route("/health")
+@app.route("/health/live")
 def health():
-    return jsonify({"status": "UP"}), 200
-
-# Tìm địa chỉ Auth Service từ Consul (thử nhiều lần nếu chưa sẵn sàng)
-def get_auth_service_url(retries=5, delay=2):
-    c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-    for attempt in range(retries):
-        services = c.agent.services()
-        for s in services.values():
-            if s["Service"] == AUTH_SERVICE_NAME:
-                return f"http://{s['Address']}:{s['Port']}"
-        time.sleep(delay)
-    return os.environ.get("AUTH_FALLBACK_URL", "http://127.0.0.1:5000")
+    body, status = liveness()
+    return jsonify(body), status
+
+# Kiểm tra service đã sẵn sàng nhận request chưa (đọc trạng thái đã cache)
+@app.route("/health/ready")
+def health_ready():
+    body, status = readiness()
+    return jsonify(body), status
 
 # Gọi Auth Service để xác thực token
 def verify_token_with_auth(token):
-    auth_url = get_auth_service_url()
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        response = requests.post(f"{auth_url}/auth/verify", headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()  # {"valid": True, "sub": {...}}
-    except requests.exceptions.RequestException:
-        pass
-    return {"valid": False, "error": "Không thể xác thực token"}
+    return clients.auth_client.verify(token)
 
 # Lấy token từ header Authorization
 def get_token_from_request():
@@ -42,6 +38,14 @@ def get_token_from_request():
         return auth_header.split(" ", 1)[1]
     return auth_header.strip()
 
+# Xác thực request: tin danh tính do API gateway gửi kèm (nếu bật
+# TRUST_GATEWAY_HEADERS và có GATEWAY_SECRET), ngược lại gọi Auth Service như bình thường
+def authenticate_request():
+    identity = gateway_identity()
+    if identity:
+        return {"valid": True, "sub": identity}
+    return verify_token_with_auth(get_token_from_request())
+
 # Hiển thị trang quản lý sách cho admin
 @app.route("/")
 @app.route("/book")
@@ -57,7 +61,23 @@ def book_user_page():
 # API lấy danh sách sách (dùng nội bộ, không cần token)
 @app.route("/books", methods=["GET"])
 def get_books_api_internal():
-    return jsonify(get_all_books()), 200
+    try:
+        projection = book_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(get_all_books(projection)), 200
+
+# API lấy thông tin một cuốn sách (dùng nội bộ, không cần token)
+@app.route("/books/<int:bid>", methods=["GET"])
+def get_book_api_internal(bid):
+    try:
+        projection = book_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    book = find_book_by_id(bid, projection)
+    if not book:
+        return jsonify({"error": "Không tìm thấy sách"}), 404
+    return jsonify(book), 200
 
 # Giảm số lượng sách (dùng khi mượn sách)
 @app.route("/books/<int:bid>/decrease", methods=["POST"])
@@ -65,44 +85,93 @@ def decrease_book_quantity(bid):
     try:
         data = request.get_json(force=True)
         qty = int(data.get("quantity", 1))
-        book = find_book_by_id(bid)
-        if not book:
+        updated = decrease_quantity(bid, qty)
+        if updated is None:
             return jsonify({"error": "Không tìm thấy sách"}), 404
-        if qty >= 0 and book["quantity"] < qty:
+        if not updated:
             return jsonify({"error": "Số lượng sách không đủ"}), 400
-
-        update_book(bid, {"quantity": book["quantity"] - qty})
         return jsonify({"message": "Cập nhật số lượng thành công"}), 200
     except Exception as e:
         return jsonify({"error": f"Lỗi server: {str(e)}"}), 500
 
-# Lấy danh sách sách (yêu cầu token hợp lệ)
+# Hoàn lại số lượng cho nhiều sách theo batch (Borrow Service gọi khi trả/xóa phiếu mượn)
+@app.route("/books/restock", methods=["POST"])
+def restock_books_api():
+    data = request.get_json(force=True) or {}
+    batch_id = data.get("batch_id")
+    items = data.get("items") or []
+    if not batch_id:
+        return jsonify({"error": "Thiếu batch_id"}), 400
+    try:
+        applied = restock_books(items, batch_id)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Dữ liệu không hợp lệ"}), 400
+    return jsonify({"batch_id": batch_id, "applied": applied}), 200
+
+# Lấy danh sách sách (yêu cầu token hợp lệ, hỗ trợ ?fields=id,title,...)
 @app.route("/book-api/books", methods=["GET"])
 def list_books():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid"):
         return jsonify({"error": "Token không hợp lệ"}), 401
-    return jsonify(get_all_books()), 200
+
+    try:
+        projection = book_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(get_all_books(projection)), 200
 
 # Thêm sách mới (chỉ admin)
 @app.route("/book-api/books", methods=["POST"])
+@limit_writes()
+@idempotent()
 def add_book_api():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "Không có quyền"}), 403
 
     data = request.get_json() or {}
-    create_book(data)
+    try:
+        create_book(data)
+    except DuplicateKeyError:
+        return jsonify({"error": "ID sách đã tồn tại"}), 400
     return jsonify({"message": "Thêm sách thành công"}), 201
 
+# Import sách hàng loạt từ file CSV hoặc NDJSON (chỉ admin)
+# Gửi file qua multipart (field "file") hoặc gửi thẳng trong body
+@app.route("/book-api/books/import", methods=["POST"])
+@limit_writes()
+@idempotent(hash_body=False)
+def import_books_api():
+    verify = authenticate_request()
+    role = (verify.get("sub") or {}).get("role")
+    if not verify.get("valid") or role != "admin":
+        return jsonify({"error": "Không có quyền"}), 403
+
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    filename = (upload.filename if upload else "") or ""
+    content_type = (upload.mimetype if upload else request.mimetype) or ""
+
+    fmt = request.args.get("format")
+    if not fmt:
+        if filename.endswith(".csv") or "csv" in content_type:
+            fmt = "csv"
+        elif filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+            fmt = "ndjson"
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "Định dạng không hỗ trợ (csv hoặc ndjson)"}), 400
+
+    summary = import_books(stream, fmt)
+    return jsonify(summary), 200
+
 # Cập nhật thông tin sách (chỉ admin)
 @app.route("/book-api/books/<int:bid>", methods=["PUT"])
+@limit_writes()
+@idempotent()
 def update_book_api(bid):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "Không có quyền"}), 403
@@ -114,9 +183,10 @@ def update_book_api(bid):
 
 # Xóa sách (chỉ admin)
 @app.route("/book-api/books/<int:bid>", methods=["DELETE"])
+@limit_writes()
+@idempotent()
 def delete_book_api(bid):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "Không có quyền"}), 403
@@ -125,7 +195,21 @@ def delete_book_api(bid):
         return jsonify({"message": "Đã xóa sách thành công"}), 200
     return jsonify({"error": "Không tìm thấy sách"}), 404
 
+# Khởi động các tác vụ nền của service
+def start_background_tasks():
+    ensure_rate_limit_indexes()
+    ensure_idempotency_indexes()
+    ensure_indexes()
+    add_check("mongo", mongo_check(mongo_client))
+    add_check("auth-service", discovery_check(AUTH_SERVICE_NAME))
+    start_health_monitor()
+    install_drain_handler()
+    mark_ready()
+
 # Khởi chạy ứng dụng
 if __name__ == "__main__":
     register_service()
-    app.run(port=SERVICE_PORT, debug=True)
\ No newline at end of file
+    start_background_tasks()
+    # Tắt reloader: process cha của reloader sẽ chạy background task lần thứ hai
+    # và ghi đè handler SIGTERM (bỏ qua bước draining)
+    app.run(host=SERVICE_HOST, port=SERVICE_PORT, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import time, hashlib, threading
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response
+from pymongo.errors import DuplicateKeyError
+from database import db
+from gateway import gateway_identity
+from rate_limit import release_write_slot, reacquire_write_slot, shed_response
+from config import IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS, IDEMPOTENCY_LOCK_SECONDS
+
+# Kết quả của các request có header Idempotency-Key (tự xóa sau TTL)
+idempotency_keys = db["idempotency_keys"]
+
+# Các mã lỗi không lưu lại để client có thể gửi lại với cùng key
+_NOT_STORED = (401, 403, 408, 429)
+
+# Tạo TTL index (gọi khi service khởi động)
+def ensure_idempotency_indexes():
+    idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Khóa lưu trữ: gắn với người gọi + endpoint để key của người khác không đụng nhau.
+# X-Auth-User chỉ được dùng khi request đến từ gateway (đúng secret), nếu không
+# người gọi có thể giả header để nhận lại response đã lưu của người khác.
+def _storage_key(key):
+    identity = gateway_identity()
+    caller = identity["username"] if identity else _sha256(request.headers.get("Authorization", ""))
+    return _sha256(f"{caller}:{request.method}:{request.path}:{key}")
+
+# Trả lại response đã lưu
+def _replay(doc):
+    response = make_response(doc["body"], doc["status"])
+    response.headers["Content-Type"] = doc["content_type"]
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def _conflict(message, status):
+    response = jsonify({"error": message})
+    response.status_code = status
+    if status == 409:
+        response.headers["Retry-After"] = "1"
+    return response
+
+# Chờ request trùng đang xử lý xong rồi trả lại kết quả của nó.
+# Trả về None nếu request trước thất bại (key đã được giải phóng).
+def _wait_for_result(doc_id, fingerprint):
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        doc = idempotency_keys.find_one({"_id": doc_id})
+        if doc is None:
+            return None
+        if doc["fingerprint"] != fingerprint:
+            return _conflict("Idempotency-Key đã được dùng cho request khác", 422)
+        if doc["state"] == "completed":
+            return _replay(doc)
+        # Process giữ key đã chết giữa chừng (ngừng gia hạn): giải phóng key để xử lý lại
+        heartbeat = doc.get("heartbeat_at", doc["created_at"])
+        if heartbeat < datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+            idempotency_keys.delete_one({"_id": doc_id, "state": "in_progress", "heartbeat_at": heartbeat})
+            return None
+        if time.monotonic() >= deadline:
+            return _conflict("Request với Idempotency-Key này đang được xử lý", 409)
+        # Giãn dần khoảng thời gian đọc lại để không dồn tải lên MongoDB
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 1)
+
+# Gia hạn key in_progress định kỳ trong lúc request còn chạy, để request chậm
+# (ví dụ import) không bị coi là bỏ dở và bị chạy lần hai
+def _start_heartbeat(doc_id):
+    stop = threading.Event()
+    def beat():
+        while not stop.wait(IDEMPOTENCY_LOCK_SECONDS / 3):
+            idempotency_keys.update_one(
+                {"_id": doc_id, "state": "in_progress"},
+                {"$set": {"heartbeat_at": datetime.utcnow()}}
+            )
+    threading.Thread(target=beat, name="idempotency-heartbeat", daemon=True).start()
+    return stop
+
+# Endpoint ghi hỗ trợ header Idempotency-Key: request đầu tiên được thực thi
+# và lưu kết quả, các lần gửi lại (kể cả đồng thời) nhận lại đúng kết quả đó.
+# hash_body=False với endpoint nhận file lớn (không đọc cả body vào bộ nhớ).
+def idempotent(hash_body=True):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get("Idempotency-Key")
+            if not key:
+                return fn(*args, **kwargs)
+            if len(key) > 255:
+                return jsonify({"error": "Idempotency-Key quá dài"}), 400
+
+            doc_id = _storage_key(key)
+            body = request.get_data(as_text=True) if hash_body else ""
+            fingerprint = _sha256(f"{request.full_path}:{body}")
+
+            released = False
+            while True:
+                try:
+                    now = datetime.utcnow()
+                    idempotency_keys.insert_one({
+                        "_id": doc_id,
+                        "state": "in_progress",
+                        "fingerprint": fingerprint,
+                        "created_at": now,
+                        "heartbeat_at": now
+                    })
+                    break
+                except DuplicateKeyError:
+                    # Chỉ chờ thì không cần slot xử lý: trả slot cho request khác
+                    released = release_write_slot() or released
+                    result = _wait_for_result(doc_id, fingerprint)
+                    if result is not None:
+                        return result
+
+            if released and not reacquire_write_slot():
+                idempotency_keys.delete_one({"_id": doc_id})
+                return shed_response()
+
+            heartbeat = _start_heartbeat(doc_id)
+            try:
+                response = make_response(fn(*args, **kwargs))
+            except Exception:
+                idempotency_keys.delete_one({"_id": doc_id})
+                raise
+            finally:
+                heartbeat.set()
+
+            if response.status_code >= 500 or response.status_code in _NOT_STORED:
+                idempotency_keys.delete_one({"_id": doc_id})
+            else:
+                idempotency_keys.update_one({"_id": doc_id}, {"$set": {
+                    "state": "completed",
+                    "status": response.status_code,
+                    "body": response.get_data(as_text=True),
+                    "content_type": response.headers.get("Content-Type", "application/json")
+                }})
+            return response
+        return wrapper
+    return decorator
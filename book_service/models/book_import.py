@@ -0,0 +1,126 @@
+import csv, json
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_REJECTED_REPORTED
+from models.book_model import collection
+
+# ---------------------- ĐỌC FILE IMPORT ----------------------
+
+# Tách stream nhị phân thành từng dòng (đọc theo khối, không giữ cả file)
+def _iter_binary_lines(binary_stream, chunk_size=64 * 1024):
+    pending = b""
+    while True:
+        chunk = binary_stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+# Giải mã UTF-8 từng dòng; dòng lỗi mã hoá chỉ bị từ chối riêng dòng đó.
+# position["line"] luôn là số dòng thực tế vừa đọc trong file.
+def _decode_lines(binary_stream, summary, position):
+    for line_no, raw in enumerate(_iter_binary_lines(binary_stream), start=1):
+        position["line"] = line_no
+        try:
+            yield raw.decode("utf-8-sig" if line_no == 1 else "utf-8")
+        except UnicodeDecodeError:
+            _reject(summary, line_no, "Dòng không phải UTF-8 hợp lệ")
+
+# Đọc từng dòng CSV (có header: id,title,author,category,quantity)
+def iter_csv_rows(lines, position):
+    for row in csv.DictReader(lines):
+        yield position["line"], row
+
+# Đọc từng dòng NDJSON (mỗi dòng một object JSON)
+def iter_ndjson_rows(lines, position):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield position["line"], json.loads(line)
+        except ValueError:
+            yield position["line"], None
+
+# Kiểm tra và chuẩn hoá một dòng dữ liệu sách, trả về (book, lỗi)
+def validate_row(row):
+    if not isinstance(row, dict):
+        return None, "Dòng không hợp lệ"
+    # null (NDJSON) hoặc thiếu cột (CSV) không được thành chuỗi "None"
+    for field in ("title", "author"):
+        if field in row and not isinstance(row[field], str):
+            return None, f"{field} phải là chuỗi"
+    try:
+        book = {
+            "id": int(row["id"]),
+            "title": str(row["title"]).strip(),
+            "author": str(row["author"]).strip(),
+            "category": str(row.get("category") or "").strip(),
+            "quantity": int(row["quantity"])
+        }
+    except KeyError as e:
+        return None, f"Thiếu trường {e.args[0]}"
+    except (TypeError, ValueError):
+        return None, "id và quantity phải là số nguyên"
+    if not book["title"] or not book["author"]:
+        return None, "title và author không được để trống"
+    if book["quantity"] < 0:
+        return None, "quantity không được âm"
+    return book, None
+
+# ---------------------- GHI THEO BATCH ----------------------
+
+# Upsert một batch sách theo id (ordered=False), cập nhật summary
+def _write_batch(batch, summary):
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"id": book["id"]},
+            {"$set": {**{k: v for k, v in book.items() if k != "id"}, "updated_at": now},
+             "$setOnInsert": {"created_at": now}},
+            upsert=True
+        )
+        for _, book in batch
+    ]
+    try:
+        result = collection.bulk_write(ops, ordered=False)
+        summary["inserted"] += result.upserted_count
+        summary["updated"] += result.matched_count
+    except BulkWriteError as e:
+        details = e.details
+        summary["inserted"] += details.get("nUpserted", 0)
+        summary["updated"] += details.get("nMatched", 0)
+        for err in details.get("writeErrors", []):
+            _reject(summary, batch[err["index"]][0], err.get("errmsg", "Lỗi ghi dữ liệu"))
+
+def _reject(summary, line_no, reason):
+    summary["rejected"] += 1
+    if len(summary["errors"]) < IMPORT_MAX_REJECTED_REPORTED:
+        summary["errors"].append({"line": line_no, "error": reason})
+
+# Import sách từ stream (csv hoặc ndjson), đọc và ghi từng batch
+# để không phải giữ toàn bộ file trong bộ nhớ
+def import_books(binary_stream, fmt):
+    summary = {"inserted": 0, "updated": 0, "rejected": 0, "errors": []}
+    position = {"line": 0}
+    lines = _decode_lines(binary_stream, summary, position)
+    rows = iter_csv_rows(lines, position) if fmt == "csv" else iter_ndjson_rows(lines, position)
+
+    batch = []
+    for line_no, row in rows:
+        book, error = validate_row(row)
+        if error:
+            _reject(summary, line_no, error)
+            continue
+        batch.append((line_no, book))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            _write_batch(batch, summary)
+            batch = []
+    if batch:
+        _write_batch(batch, summary)
+    return summary
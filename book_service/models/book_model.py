@@ -1,11 +1,21 @@
-from pymongo import MongoClient
+from pymongo import UpdateOne
 from datetime import datetime
-from config import MONGO_URI
+from database import db, for_reads, build_projection
+from config import RESTOCK_BATCHES_KEPT
 
-client = MongoClient(MONGO_URI)
-db = client["bookdb"]
 collection = db["books"]
 
+# Các trường được phép trả về qua API
+BOOK_FIELDS = ("id", "title", "author", "category", "quantity", "created_at", "updated_at")
+
+# Projection cho tham số fields= của API sách
+def book_projection(fields=None):
+    return build_projection(fields, BOOK_FIELDS, BOOK_FIELDS)
+
+# Tạo index cần thiết (gọi khi service khởi động)
+def ensure_indexes():
+    collection.create_index("id", unique=True)
+
 # Tạo sách mới trong database
 def create_book(data):
     now = datetime.utcnow()
@@ -22,18 +32,18 @@ def create_book(data):
     return book
 
 # Lấy danh sách tất cả sách
-def get_all_books():
-    books = list(collection.find({}, {"_id": 0}))
+def get_all_books(projection=None):
+    books = list(for_reads(collection).find({}, projection or book_projection()))
     return books
 
 # Tìm sách theo ID
-def find_book_by_id(book_id):
-    book = collection.find_one({"id": book_id}, {"_id": 0})
+def find_book_by_id(book_id, projection=None):
+    book = collection.find_one({"id": book_id}, projection or book_projection())
     return book
 
 # Lấy thông tin sách theo ID
 def get_book_by_id(bid):
-    return collection.find_one({"id":bid}, {"_id": 0})
+    return collection.find_one({"id":bid}, book_projection())
 
 # Cập nhật thông tin sách
 def update_book(bid, data):
@@ -42,7 +52,43 @@ def update_book(bid, data):
     result = collection.update_one({"id": bid}, {"$set": update_data})
     return result.modified_count > 0
 
+# Trừ số lượng sách (số âm để cộng lại) trong một lần ghi.
+# Trả về None nếu không tìm thấy sách, False nếu không đủ số lượng.
+def decrease_quantity(bid, qty):
+    query = {"id": bid}
+    if qty >= 0:
+        query["quantity"] = {"$gte": qty}
+    result = collection.update_one(query, {"$inc": {"quantity": -qty}, "$set": {"updated_at": datetime.utcnow()}})
+    if result.matched_count:
+        return True
+    if not collection.find_one({"id": bid}, {"_id": 1}):
+        return None
+    return False
+
 # Xóa sách khỏi database
 def delete_book(bid):
     result = collection.delete_one({"id": bid})
-    return result.deleted_count > 0
\ No newline at end of file
+    return result.deleted_count > 0
+
+# Cộng lại số lượng cho nhiều sách trong một lần ghi.
+# Mỗi sách tự ghi nhớ các batch_id đã cộng (cùng trong một lệnh cập nhật) nên
+# gửi lại batch, kể cả sau khi lỗi giữa chừng, chỉ cộng những sách còn thiếu.
+def restock_books(items, batch_id):
+    quantities = {}
+    for item in items:
+        book_id = int(item["book_id"])
+        quantities[book_id] = quantities.get(book_id, 0) + int(item["quantity"])
+    if not quantities:
+        return True
+
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"id": book_id, "applied_batches": {"$ne": batch_id}},
+            {"$inc": {"quantity": qty}, "$set": {"updated_at": now},
+             "$push": {"applied_batches": {"$each": [batch_id], "$slice": -RESTOCK_BATCHES_KEPT}}}
+        )
+        for book_id, qty in quantities.items()
+    ]
+    result = collection.bulk_write(ops, ordered=False)
+    return result.modified_count > 0
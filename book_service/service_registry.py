@@ -1,12 +1,139 @@
-import consul
-from config import SERVICE_NAME, SERVICE_PORT, CONSUL_HOST, CONSUL_PORT
+import consul, socket, atexit, os, itertools, threading, time
+import requests
+from urllib3.exceptions import NewConnectionError
+from config import (
+    SERVICE_NAME, SERVICE_PORT, SERVICE_ADDRESS, CONSUL_HOST, CONSUL_PORT, CONSUL_ENABLED, CONSUL_DEREGISTER_AFTER,
+    DISCOVERY_REFRESH_SECONDS, LB_STRATEGY
+)
+
+# ID riêng cho từng instance để nhiều replica cùng tên không ghi đè nhau
+SERVICE_ID = os.environ.get("SERVICE_ID") or f"{SERVICE_NAME}-{socket.gethostname()}-{SERVICE_PORT}"
+
+# Địa chỉ mà các service khác (và Consul) dùng để gọi tới instance này
+def get_advertised_address():
+    if SERVICE_ADDRESS:
+        return SERVICE_ADDRESS
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except socket.error:
+        return "127.0.0.1"
 
 def register_service():
-    c = consul.Consul(host = CONSUL_HOST, port = CONSUL_PORT)
+    if not CONSUL_ENABLED:
+        return
+    address = get_advertised_address()
+    c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
     c.agent.service.register(
         SERVICE_NAME,
-        address="localhost",
+        service_id=SERVICE_ID,
+        address=address,
         port=SERVICE_PORT,
-        check=consul.Check.http(f"http://localhost:{SERVICE_PORT}/health", interval="10s")
+        check=consul.Check.http(f"http://{address}:{SERVICE_PORT}/health/ready", interval="10s", deregister=CONSUL_DEREGISTER_AFTER)
     )
-    print(f"[CONSUL] REGISTERED {SERVICE_NAME} ON PORT: {SERVICE_PORT}")
+    atexit.register(deregister_service)
+    print(f"[CONSUL] Registered {SERVICE_ID} at {address}:{SERVICE_PORT}")
+
+# Gỡ instance khỏi Consul khi tắt service
+def deregister_service():
+    try:
+        c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
+        c.agent.service.deregister(SERVICE_ID)
+        print(f"[CONSUL] Deregistered {SERVICE_ID}")
+    except Exception as e:
+        print(f"[CONSUL] Deregister failed: {e}")
+
+# Kiểm tra một service phụ thuộc có instance nào healthy trên Consul không
+def discovery_check(service_name):
+    def check():
+        if not CONSUL_ENABLED:
+            return True, {"consul": "disabled"}
+        c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
+        _, nodes = c.health.service(service_name, passing=True)
+        return len(nodes) > 0, {"instances": len(nodes)}
+    return check
+
+# ---------------- CLIENT-SIDE LOAD BALANCING ----------------
+
+# Cache danh sách instance healthy của một service và chọn instance để gọi
+# (round_robin hoặc least_outstanding: ít request đang xử lý nhất)
+class ServiceBalancer:
+    def __init__(self, service_name, fallback_url, strategy=LB_STRATEGY):
+        self.service_name = service_name
+        self.fallback_url = fallback_url
+        self.strategy = strategy
+        self._instances = []
+        self._fetched_at = 0
+        self._outstanding = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    # Lấy lại danh sách instance từ Consul (chỉ các instance passing)
+    def _refresh(self):
+        c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
+        _, nodes = c.health.service(self.service_name, passing=True)
+        self._instances = [
+            f"http://{n['Service']['Address'] or n['Node']['Address']}:{n['Service']['Port']}"
+            for n in nodes
+        ]
+        self._fetched_at = time.monotonic()
+
+    def instances(self):
+        if not CONSUL_ENABLED:
+            return [self.fallback_url]
+        with self._lock:
+            if not self._instances or time.monotonic() - self._fetched_at > DISCOVERY_REFRESH_SECONDS:
+                try:
+                    self._refresh()
+                except Exception as e:
+                    print(f"[CONSUL] Cannot discover {self.service_name}: {e}")
+            return list(self._instances) or [self.fallback_url]
+
+    # Chọn một instance và tăng bộ đếm request đang xử lý
+    def acquire(self):
+        candidates = self.instances()
+        with self._lock:
+            if self.strategy == "least_outstanding":
+                url = min(candidates, key=lambda u: self._outstanding.get(u, 0))
+            else:
+                url = candidates[next(self._counter) % len(candidates)]
+            self._outstanding[url] = self._outstanding.get(url, 0) + 1
+        return url
+
+    def release(self, url):
+        with self._lock:
+            self._outstanding[url] = max(self._outstanding.get(url, 1) - 1, 0)
+
+    # Bỏ instance lỗi khỏi danh sách cho tới lần refresh tiếp theo
+    def mark_failed(self, url):
+        with self._lock:
+            if url in self._instances:
+                self._instances.remove(url)
+
+_session = requests.Session()
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Lỗi xảy ra khi đang mở kết nối: request chắc chắn chưa được gửi đi.
+# Lỗi như connection reset trên socket keep-alive cũ thì có thể server đã nhận request.
+def _not_sent(error):
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+# Gọi service khác qua load balancer; chỉ thử instance khác khi request chưa
+# tới được server, hoặc khi method không có tác dụng phụ (GET/HEAD)
+def call_service(balancer, method, path, retries=2, **kwargs):
+    kwargs.setdefault("timeout", 5)
+    last_error = None
+    for _ in range(retries + 1):
+        url = balancer.acquire()
+        try:
+            return _session.request(method, f"{url}{path}", **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            balancer.mark_failed(url)
+            if method.upper() not in SAFE_METHODS and not _not_sent(e):
+                raise
+            last_error = e
+        finally:
+            balancer.release(url)
+    raise last_error
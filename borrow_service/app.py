@@ -1,40 +1,24 @@
 from flask import Flask, render_template, request, jsonify
-from pymongo import MongoClient
-from service_registry import register_service
+from service_registry import register_service, discovery_check
+import clients
+from gateway import gateway_identity
+from outbox import ensure_outbox_indexes, mark_returned, start_outbox_worker
+from database import client as mongo_client
+from models.borrow_model import borrows, borrow_history as archived_borrows, find_all_borrows, borrow_projection, init_borrow_counter, next_borrow_id
+from archive import ensure_archive_indexes, start_archiver, archive_metrics
+from overdue import ensure_overdue_indexes, start_overdue_sweeper, sweep_metrics
+from rate_limit import limit_writes, ensure_rate_limit_indexes
+from idempotency import idempotent, ensure_idempotency_indexes
+from health import add_check, mongo_check, start_health_monitor, install_drain_handler, mark_ready, liveness, readiness
 from config import *
 from datetime import datetime, timedelta
-import requests, consul, time, os
 
 app = Flask(__name__)
 app.secret_key = "borrow_secret"
 
-client = MongoClient(MONGO_URI)
-db = client["borrow_db"]
-borrows = db["borrows"]
-
-# Tìm địa chỉ Auth Service từ Consul (thử nhiều lần nếu chưa sẵn sàng)
-def get_auth_service_url(retries=5, delay=2):
-    c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-    for attempt in range(retries):
-        services = c.agent.services()
-        for s in services.values():
-            if s["Service"] == AUTH_SERVICE_NAME:
-                return f"http://{s['Address']}:{s['Port']}"
-        time.sleep(delay)
-    return os.environ.get("AUTH_FALLBACK_URL", "http://127.0.0.1:5000")
-
 # Gọi Auth Service để xác thực token
 def verify_token_with_auth(token):
-    auth_url = get_auth_service_url()
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        res = requests.post(f"{auth_url}/auth/verify", headers=headers, timeout=5)
-        if res.status_code == 200:
-            return res.json()
-        else:
-            return {"valid": False, "error": res.text}
-    except requests.exceptions.RequestException as e:
-        return {"valid": False, "error": str(e)}
+    return clients.auth_client.verify(token)
 
 # Lấy token từ header Authorization
 def get_token_from_request():
@@ -43,10 +27,31 @@ def get_token_from_request():
         return auth_header.split(" ", 1)[1]
     return auth_header.strip()
 
-# Kiểm tra service có hoạt động không
+# Xác thực request: tin danh tính do API gateway gửi kèm (nếu bật
+# TRUST_GATEWAY_HEADERS và có GATEWAY_SECRET), ngược lại gọi Auth Service như bình thường
+def authenticate_request():
+    identity = gateway_identity()
+    if identity:
+        return {"valid": True, "sub": identity}
+    return verify_token_with_auth(get_token_from_request())
+
+# Kiểm tra service có hoạt động không (liveness)
 @app.route("/health")
+@app.route("/health/live")
 def health():
-    return jsonify({"status": "UP"}), 200
+    body, status = liveness()
+    return jsonify(body), status
+
+# Kiểm tra service đã sẵn sàng nhận request chưa (đọc trạng thái đã cache)
+@app.route("/health/ready")
+def health_ready():
+    body, status = readiness()
+    return jsonify(body), status
+
+# Số liệu các job nền (thời gian quét, kích thước batch)
+@app.route("/metrics")
+def metrics():
+    return jsonify({"overdue_sweeper": sweep_metrics, "archiver": archive_metrics}), 200
 
 # Hiển thị trang mượn sách cho user
 @app.route("/")
@@ -63,8 +68,7 @@ def borrow_admin_page():
 # Lấy danh sách phiếu mượn (admin: tất cả, user: của mình)
 @app.route("/borrow-api/list", methods=["GET"])
 def list_borrows():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid"):
         return jsonify({"error": "Token không hợp lệ"}), 401
 
@@ -72,46 +76,60 @@ def list_borrows():
     username = sub.get("username")
     role = sub.get("role")
 
+    try:
+        projection = borrow_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if role == "admin":
-        data = list(borrows.find({}, {"_id": 0}))
+        data = list(find_all_borrows({}, projection))
     else:
-        data = list(borrows.find({"username": username}, {"_id": 0}))
+        data = list(find_all_borrows({"username": username}, projection))
     return jsonify(data), 200
 
 # Lấy sách đang mượn của user (chưa trả)
 @app.route("/borrow-api/my-borrows", methods=["GET"])
 def my_borrows():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid"):
         return jsonify({"error": "Token không hợp lệ"}), 401
     
     username = verify["sub"]["username"]
+    try:
+        projection = borrow_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Chỉ lấy các phiếu mượn chưa trả (status != "returned")
     data = list(borrows.find({
         "username": username,
         "status": {"$ne": "returned"}
-    }, {"_id": 0}).sort("borrow_date", -1))
+    }, projection).sort("borrow_date", -1))
     
     return jsonify(data), 200
 
 # Lấy lịch sử mượn trả (chỉ admin)
 @app.route("/borrow-api/history", methods=["GET"])
 def borrow_history():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid") or verify["sub"]["role"] != "admin":
         return jsonify({"error": "Không có quyền"}), 403
+
+    try:
+        projection = borrow_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Lấy tất cả phiếu mượn, bao gồm cả đã trả
-    data = list(borrows.find({}, {"_id": 0}).sort("borrow_date", -1))
+    # Lấy tất cả phiếu mượn, bao gồm cả đã trả (kể cả phiếu đã lưu trữ)
+    data = list(find_all_borrows({}, projection))
     return jsonify(data), 200
 
 # Tạo phiếu mượn sách mới (trừ số lượng trong kho)
-@app.route("/borrow-api/borrow", methods=["POST"]) 
+@app.route("/borrow-api/borrow", methods=["POST"])
+@limit_writes()
+@idempotent()
 def borrow_book():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid"):
         return jsonify({"error": "Token không hợp lệ"}), 401
     username = verify["sub"]["username"]
@@ -122,10 +140,9 @@ def borrow_book():
     days = int(data.get("days", 1))
 
     try:
-        # Gọi Book Service nội bộ trong cùng mạng Docker
-        book_info = requests.get("http://book_service:5002/books").json()
-        book = next((b for b in book_info if b["id"] == book_id), None)
-        if not book:
+        # Gọi Book Service (qua Consul + cân bằng tải, hoặc gọi trực tiếp ở chế độ all-in-one)
+        book, status = clients.book_client.get_book(book_id, fields="id,title,quantity")
+        if status == 404:
             return jsonify({"error": "Không tìm thấy sách này!"}), 404
         if quantity <= 0 or book["quantity"] < quantity:
             return jsonify({"error": "Số lượng không hợp lệ"}), 400
@@ -133,18 +150,14 @@ def borrow_book():
         return jsonify({"error": f"Lỗi khi lấy dữ liệu sách: {str(e)}"}), 500
 
     try:
-        res = requests.post(
-            f"http://book_service:5002/books/{book_id}/decrease",
-            json={"quantity": quantity},
-            timeout=5
-        )
-        if res.status_code != 200:
-            return jsonify(res.json()), res.status_code
-    except requests.exceptions.RequestException as e:
+        body, status = clients.book_client.decrease(book_id, quantity)
+        if status != 200:
+            return jsonify(body), status
+    except Exception as e:
         return jsonify({"error": f"Không thể kết nối Book Service: {str(e)}"}), 500
 
     new_borrow = {
-        "borrow_id": borrows.count_documents({}) + 1,
+        "borrow_id": next_borrow_id(),
         "username": username,
         "book_id": book_id,
         "book_title": book["title"],
@@ -152,16 +165,17 @@ def borrow_book():
         "days": days,
         "borrow_date": datetime.utcnow(),
         "return_date": datetime.utcnow() + timedelta(days=days),
-        "status": "borrowing"  # Trạng thái: borrowing, returned
+        "status": "borrowing"  # Trạng thái: borrowing, overdue, returned
     }
     borrows.insert_one(new_borrow)
     return jsonify({"message": "Mượn sách thành công!"}), 201
 
 # User tự trả sách (cộng lại số lượng vào kho)
 @app.route("/borrow-api/return/<int:borrow_id>", methods=["POST"])
+@limit_writes()
+@idempotent()
 def return_book(borrow_id):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid"):
         return jsonify({"error": "Token không hợp lệ"}), 401
     
@@ -175,56 +189,57 @@ def return_book(borrow_id):
     if borrow["username"] != username and verify["sub"]["role"] != "admin":
         return jsonify({"error": "Không có quyền"}), 403
     
-    if borrow.get("status") == "returned":
+    # Cập nhật trạng thái và ghi yêu cầu hoàn kho vào outbox (worker nền sẽ gửi sang Book Service)
+    if borrow.get("status") == "returned" or not mark_returned(borrow_id):
         return jsonify({"error": "Sách đã được trả rồi"}), 400
     
-    # Trả sách: cộng lại số lượng vào kho
-    try:
-        requests.post(
-            f"http://book_service:5002/books/{borrow['book_id']}/decrease",
-            json={"quantity": -borrow["quantity"]},
-            timeout=5
-        )
-    except:
-        pass
-    
-    # Cập nhật trạng thái
-    borrows.update_one(
-        {"borrow_id": borrow_id},
-        {"$set": {
-            "status": "returned",
-            "actual_return_date": datetime.utcnow()
-        }}
-    )
-    
     return jsonify({"message": "Trả sách thành công!"}), 200
 
 # Xóa phiếu mượn (chỉ admin, hoàn lại số lượng nếu chưa trả)
 @app.route("/borrow-api/<int:borrow_id>", methods=["DELETE"])
+@limit_writes()
+@idempotent()
 def delete_borrow(borrow_id):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     if not verify.get("valid") or verify["sub"]["role"] != "admin":
         return jsonify({"error": "Không có quyền"}), 403
 
     borrow = borrows.find_one({"borrow_id": borrow_id})
     if not borrow:
+        # Phiếu đã lưu trữ (đã trả) thì chỉ cần xóa khỏi lịch sử
+        if archived_borrows.delete_one({"borrow_id": borrow_id}).deleted_count:
+            return jsonify({"message": "Đã xóa phiếu mượn"}), 200
         return jsonify({"error": "Không tìm thấy phiếu mượn"}), 404
 
-    # Nếu chưa trả, hoàn lại số lượng
+    # Nếu chưa trả, ghi yêu cầu hoàn lại số lượng vào outbox trước khi xóa
     if borrow.get("status") != "returned":
-        try:
-            requests.post(
-                f"http://book_service:5002/books/{borrow['book_id']}/decrease",
-                json={"quantity": -borrow["quantity"]}
-            )
-        except:
-            pass
+        mark_returned(borrow_id)
 
     borrows.delete_one({"borrow_id": borrow_id})
     return jsonify({"message": "Đã xóa phiếu mượn"}), 200
 
+# Khởi động các tác vụ nền của service
+def start_background_tasks():
+    ensure_rate_limit_indexes()
+    ensure_idempotency_indexes()
+    add_check("mongo", mongo_check(mongo_client))
+    add_check("auth-service", discovery_check(AUTH_SERVICE_NAME))
+    add_check("book-service", discovery_check(BOOK_SERVICE_NAME))
+    ensure_outbox_indexes()
+    start_outbox_worker()
+    ensure_overdue_indexes()
+    start_overdue_sweeper()
+    init_borrow_counter()
+    ensure_archive_indexes()
+    start_archiver()
+    start_health_monitor()
+    install_drain_handler()
+    mark_ready()
+
 # Khởi chạy ứng dụng
 if __name__ == "__main__":
     register_service()
-    app.run(port=SERVICE_PORT, debug=True)
\ No newline at end of file
+    start_background_tasks()
+    # Tắt reloader: process cha của reloader sẽ chạy background task lần thứ hai
+    # và ghi đè handler SIGTERM (bỏ qua bước draining)
+    app.run(host=SERVICE_HOST, port=SERVICE_PORT, debug=True, use_reloader=False)
\ No newline at end of file
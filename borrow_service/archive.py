@@ -0,0 +1,79 @@
+import threading, time
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+from models.borrow_model import borrows, borrow_history
+from lease import acquire_lease
+from config import ARCHIVE_INTERVAL, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_LEASE_SECONDS
+
+LEASE_NAME = "borrow-archiver"
+
+# Số liệu của lần lưu trữ gần nhất (xem qua /metrics)
+archive_metrics = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_duration_ms": None,
+    "last_archived": 0,
+    "total_archived": 0
+}
+
+# Index cho việc chọn phiếu cần lưu trữ và đọc lịch sử
+def ensure_archive_indexes():
+    borrows.create_index([("status", 1), ("actual_return_date", 1)])
+    borrows.create_index("borrow_id")
+    borrow_history.create_index("borrow_id")
+    borrow_history.create_index([("username", 1), ("borrow_date", -1)])
+    borrow_history.create_index([("borrow_date", -1)])
+
+# Chuyển các phiếu đã trả lâu hơn ARCHIVE_AFTER_DAYS sang borrow_history theo batch.
+# Giữ nguyên _id nên nếu bị ngắt giữa chừng, lần chạy sau chèn trùng sẽ được bỏ qua.
+def archive_returned():
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+    query = {
+        "status": "returned",
+        "actual_return_date": {"$lt": cutoff},
+        "restock_pending": {"$exists": False}
+    }
+    archived = 0
+
+    while True:
+        batch = list(borrows.find(query).limit(ARCHIVE_BATCH_SIZE))
+        if not batch:
+            break
+        try:
+            borrow_history.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Chỉ bỏ qua lỗi trùng _id (đã lưu trữ ở lần chạy trước)
+            if any(err["code"] != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        result = borrows.delete_many({"_id": {"$in": [b["_id"] for b in batch]}})
+        archived += result.deleted_count
+
+        if len(batch) < ARCHIVE_BATCH_SIZE or not acquire_lease(LEASE_NAME, ARCHIVE_LEASE_SECONDS):
+            break
+
+    archive_metrics.update({
+        "runs": archive_metrics["runs"] + 1,
+        "last_run_at": now.isoformat(),
+        "last_duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "last_archived": archived,
+        "total_archived": archive_metrics["total_archived"] + archived
+    })
+    return archived
+
+# Vòng lặp nền: chỉ replica giữ lease mới lưu trữ
+def _archiver_loop():
+    while True:
+        try:
+            if acquire_lease(LEASE_NAME, ARCHIVE_LEASE_SECONDS):
+                archive_returned()
+        except Exception as e:
+            print(f"[ARCHIVE] Archive failed: {e}")
+        time.sleep(ARCHIVE_INTERVAL)
+
+# Khởi động job lưu trữ phiếu mượn chạy nền
+def start_archiver():
+    t = threading.Thread(target=_archiver_loop, name="borrow-archiver", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,55 @@
+import requests
+from service_registry import ServiceBalancer, call_service
+from config import AUTH_SERVICE_NAME, AUTH_FALLBACK_URL, BOOK_SERVICE_NAME, BOOK_FALLBACK_URL
+
+# Giao diện gọi sang các service khác. Mặc định gọi qua HTTP (Consul + cân bằng tải);
+# chế độ all-in-one thay bằng bản gọi hàm trực tiếp trong cùng process qua use().
+
+# Xác thực token qua Auth Service
+class HttpAuthClient:
+    def __init__(self):
+        self.balancer = ServiceBalancer(AUTH_SERVICE_NAME, AUTH_FALLBACK_URL)
+
+    def verify(self, token):
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            res = call_service(self.balancer, "POST", "/auth/verify", headers=headers, timeout=5)
+            if res.status_code == 200:
+                return res.json()  # {"valid": True, "sub": {...}}
+            return {"valid": False, "error": "Token không hợp lệ"}
+        except requests.exceptions.RequestException as e:
+            return {"valid": False, "error": f"Không thể xác thực token: {str(e)}"}
+
+# Tra cứu và cập nhật số lượng sách qua Book Service.
+# Các hàm trả về (body, status) giống response HTTP.
+class HttpBookClient:
+    def __init__(self):
+        self.balancer = ServiceBalancer(BOOK_SERVICE_NAME, BOOK_FALLBACK_URL)
+
+    def get_book(self, book_id, fields=None):
+        res = call_service(self.balancer, "GET", f"/books/{book_id}", params={"fields": fields})
+        return res.json(), res.status_code
+
+    def decrease(self, book_id, quantity):
+        res = call_service(self.balancer, "POST", f"/books/{book_id}/decrease", json={"quantity": quantity})
+        return res.json(), res.status_code
+
+    # Cộng lại số lượng theo batch; trả về True nếu Book Service đã nhận batch
+    def restock(self, batch_id, items):
+        res = call_service(
+            self.balancer, "POST", "/books/restock",
+            json={"batch_id": batch_id, "items": items},
+            timeout=10
+        )
+        return res.status_code == 200
+
+auth_client = HttpAuthClient()
+book_client = HttpBookClient()
+
+# Thay client mặc định (dùng cho chế độ all-in-one)
+def use(auth=None, book=None):
+    global auth_client, book_client
+    if auth:
+        auth_client = auth
+    if book:
+        book_client = book
@@ -0,0 +1,41 @@
+from pymongo import MongoClient, ReadPreference
+from config import (
+    MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_COMPRESSORS, MONGO_READ_SECONDARY_PREFERRED
+)
+
+# Một MongoClient duy nhất cho cả process (thread-safe, dùng chung connection pool)
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    compressors=MONGO_COMPRESSORS or None
+)
+db = client["borrow_db"]
+
+# Collection dùng cho các endpoint chỉ đọc nặng: đọc từ secondary (nếu bật)
+# để phân tải đọc trên replica set, ghi vẫn luôn vào primary
+def for_reads(collection):
+    if MONGO_READ_SECONDARY_PREFERRED:
+        return collection.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    return collection
+
+# Chuyển tham số fields=a,b,c thành projection MongoDB, chỉ cho phép các trường
+# trong allowed; không truyền fields thì dùng default (không bao giờ chứa dữ liệu nhạy cảm)
+def build_projection(fields, allowed, default):
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else []
+    # fields= rỗng (",", " "...) dùng danh sách mặc định: projection {"_id": 0}
+    # không có trường nào sẽ thành projection loại trừ và trả về mọi trường
+    if not names:
+        names = list(default)
+    invalid = [f for f in names if f not in allowed]
+    if invalid:
+        raise ValueError(f"Trường không hợp lệ: {', '.join(invalid)}")
+    projection = {f: 1 for f in names}
+    projection["_id"] = 0
+    return projection
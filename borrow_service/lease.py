@@ -0,0 +1,29 @@
+import os, uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from database import db
+from service_registry import SERVICE_ID
+
+# Lease trong MongoDB: đảm bảo mỗi job nền chỉ chạy trên một replica
+leases = db["leases"]
+
+# Chủ lease riêng cho từng process: SERVICE_ID có thể trùng giữa các process
+# (cùng container, hoặc cấu hình SERVICE_ID giống nhau) nên thêm pid và uuid
+LEASE_OWNER = f"{SERVICE_ID}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Giành hoặc gia hạn lease; trả về False nếu replica khác đang giữ
+def acquire_lease(name, ttl_seconds, owner=LEASE_OWNER):
+    now = datetime.utcnow()
+    try:
+        leases.update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+# Trả lease để replica khác có thể nhận ngay
+def release_lease(name, owner=LEASE_OWNER):
+    leases.delete_one({"_id": name, "owner": owner})
@@ -1,27 +1,75 @@
-from pymongo import MongoClient
+from pymongo import ReturnDocument
 from datetime import datetime, timedelta
-from config import MONGO_URI
+from database import db, for_reads, build_projection
+import heapq
 
-client = MongoClient(MONGO_URI)
-db = client["borrow_db"]
 
 borrows = db["borrows"]
+borrow_history = db["borrow_history"]  # phiếu đã trả được lưu trữ (cold)
+counters = db["counters"]
 books = db["books"]  # liên kết với dữ liệu sách
 
+# Các trường được phép trả về qua API (không gồm cờ nội bộ như restock_pending)
+BORROW_FIELDS = (
+    "borrow_id", "username", "book_id", "book_title", "quantity", "days",
+    "borrow_date", "return_date", "actual_return_date", "overdue_at", "status"
+)
+
+# Projection cho tham số fields= của API phiếu mượn
+def borrow_projection(fields=None):
+    """Tạo projection theo danh sách trường được phép"""
+    return build_projection(fields, BORROW_FIELDS, BORROW_FIELDS)
+
+# ---------------------- MÃ PHIẾU MƯỢN ----------------------
+
+# Khởi tạo bộ đếm borrow_id từ mã lớn nhất hiện có (gọi khi service khởi động)
+def init_borrow_counter():
+    """Khởi tạo bộ đếm borrow_id"""
+    last = 0
+    for col in (borrows, borrow_history):
+        doc = col.find_one({}, {"borrow_id": 1}, sort=[("borrow_id", -1)])
+        if doc:
+            last = max(last, doc["borrow_id"])
+    counters.update_one({"_id": "borrow_id"}, {"$max": {"seq": last}}, upsert=True)
+
+# Lấy borrow_id tiếp theo (không dựa vào số lượng document, vì phiếu có thể bị xóa hoặc lưu trữ)
+def next_borrow_id():
+    """Cấp borrow_id mới"""
+    doc = counters.find_one_and_update(
+        {"_id": "borrow_id"}, {"$inc": {"seq": 1}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["seq"]
+
+# Đọc phiếu mượn từ cả collection đang hoạt động và lịch sử,
+# gộp lại theo borrow_date giảm dần (dùng cho các endpoint danh sách, có thể đọc từ secondary)
+def find_all_borrows(query, projection=None):
+    """Tìm phiếu mượn trong cả borrows và borrow_history"""
+    projection = dict(projection or borrow_projection())
+    # Cần borrow_date để gộp; nếu client không yêu cầu thì bỏ đi sau khi gộp
+    drop_date = "borrow_date" not in projection
+    projection["borrow_date"] = 1
+    hot = for_reads(borrows).find(query, projection).sort("borrow_date", -1)
+    cold = for_reads(borrow_history).find(query, projection).sort("borrow_date", -1)
+    merged = heapq.merge(hot, cold, key=lambda b: b["borrow_date"], reverse=True)
+    if not drop_date:
+        return merged
+    return ({k: v for k, v in b.items() if k != "borrow_date"} for b in merged)
+
 # Lấy toàn bộ phiếu mượn
 def get_all_borrows():
     """Lấy toàn bộ phiếu mượn"""
-    return list(borrows.find({}, {"_id": 0}))
+    return list(borrows.find({}, borrow_projection()))
 
 # Lấy phiếu mượn đang hoạt động (chưa trả)
 def get_active_borrows():
     """Lấy phiếu mượn đang hoạt động (chưa trả)"""
-    return list(borrows.find({"status": {"$ne": "returned"}}, {"_id": 0}))
+    return list(borrows.find({"status": {"$ne": "returned"}}, borrow_projection()))
 
 # Lấy toàn bộ lịch sử mượn trả
 def get_borrow_history():
     """Lấy toàn bộ lịch sử mượn trả"""
-    return list(borrows.find({}, {"_id": 0}).sort("borrow_date", -1))
+    return list(find_all_borrows({}))
 
 # Lấy phiếu mượn của user (chưa trả)
 def get_user_borrows(username):
@@ -29,12 +77,12 @@ def get_user_borrows(username):
     return list(borrows.find({
         "username": username,
         "status": {"$ne": "returned"}
-    }, {"_id": 0}).sort("borrow_date", -1))
+    }, borrow_projection()).sort("borrow_date", -1))
 
 # Tìm phiếu mượn theo ID
 def get_borrow_by_id(borrow_id):
     """Tìm phiếu mượn theo ID"""
-    return borrows.find_one({"borrow_id": int(borrow_id)}, {"_id": 0})
+    return borrows.find_one({"borrow_id": int(borrow_id)}, borrow_projection())
 
 # Tạo phiếu mượn mới và trừ số lượng sách trong kho
 def create_borrow(data):
@@ -52,7 +100,7 @@ def create_borrow(data):
 
     # ✅ Lưu phiếu mượn
     borrow = {
-        "borrow_id": borrows.count_documents({}) + 1,
+        "borrow_id": next_borrow_id(),
         "username": data["username"],
         "book_id": int(data["book_id"]),
         "book_title": book["title"],
@@ -60,7 +108,7 @@ def create_borrow(data):
         "days": int(data["days"]),
         "borrow_date": now,
         "return_date": now + timedelta(days=int(data["days"])),
-        "status": "borrowing"  # borrowing, returned
+        "status": "borrowing"  # borrowing, overdue, returned
     }
     borrows.insert_one(borrow)
     return {"message": "Mượn thành công!", "borrow": borrow}
@@ -0,0 +1,138 @@
+import threading, time, uuid
+from datetime import datetime, timedelta
+from database import db
+from models.borrow_model import borrows
+import clients
+from config import (
+    OUTBOX_POLL_INTERVAL, OUTBOX_BATCH_SIZE, OUTBOX_RETRY_BASE_SECONDS,
+    OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_INFLIGHT_SECONDS, OUTBOX_DONE_TTL_SECONDS
+)
+
+# Outbox: các yêu cầu hoàn kho chờ gửi sang Book Service
+# Mỗi phiếu mượn có đúng một entry (_id = "borrow:<borrow_id>"). Entry đã gửi
+# xong được giữ lại ở trạng thái done (tự xóa sau TTL) để lần ghi lại outbox
+# (ví dụ khi phục hồi) không tạo entry mới và hoàn kho lần hai.
+outbox = db["inventory_outbox"]
+
+# Tạo index cho outbox (gọi khi service khởi động)
+def ensure_outbox_indexes():
+    outbox.create_index([("state", 1), ("next_attempt_at", 1)])
+    outbox.create_index("batch_id", sparse=True)
+    outbox.create_index("done_at", expireAfterSeconds=OUTBOX_DONE_TTL_SECONDS)
+    borrows.create_index("restock_pending", sparse=True)
+
+# Ghi yêu cầu hoàn kho cho phiếu mượn, rồi bỏ cờ restock_pending (hai lần ghi riêng).
+# Gọi lại nhiều lần vẫn chỉ có một entry, kể cả khi entry đã gửi xong (done).
+def enqueue_restock(borrow):
+    now = datetime.utcnow()
+    outbox.update_one(
+        {"_id": f"borrow:{borrow['borrow_id']}"},
+        {"$setOnInsert": {
+            "book_id": borrow["book_id"],
+            "quantity": borrow["quantity"],
+            "state": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now
+        }},
+        upsert=True
+    )
+    borrows.update_one({"borrow_id": borrow["borrow_id"]}, {"$unset": {"restock_pending": ""}})
+
+# Đánh dấu phiếu mượn đã trả và cần hoàn kho trong cùng một lần ghi (atomic),
+# sau đó ghi vào outbox ở bước riêng; nếu process dừng giữa hai bước thì
+# recover_pending_restocks ghi lại. Trả về None nếu phiếu đã được trả trước đó.
+def mark_returned(borrow_id):
+    borrow = borrows.find_one_and_update(
+        {"borrow_id": borrow_id, "status": {"$ne": "returned"}},
+        {"$set": {
+            "status": "returned",
+            "actual_return_date": datetime.utcnow(),
+            "restock_pending": True
+        }}
+    )
+    if borrow:
+        enqueue_restock(borrow)
+    return borrow
+
+# Gom số lượng theo book_id và gửi một batch sang Book Service
+def _send_batch(batch_id, entries):
+    totals = {}
+    for e in entries:
+        totals[e["book_id"]] = totals.get(e["book_id"], 0) + e["quantity"]
+    items = [{"book_id": book_id, "quantity": qty} for book_id, qty in totals.items()]
+    ids = [e["_id"] for e in entries]
+
+    try:
+        sent = clients.book_client.restock(batch_id, items)
+    except Exception:
+        sent = False
+
+    if sent:
+        outbox.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"state": "done", "done_at": datetime.utcnow()}}
+        )
+        return
+
+    # Gửi lỗi: giữ nguyên batch_id, thử lại sau (exponential backoff)
+    attempts = max(e.get("attempts", 0) for e in entries) + 1
+    delay = min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+    outbox.update_many(
+        {"_id": {"$in": ids}},
+        {"$set": {"next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}, "$inc": {"attempts": 1}}
+    )
+    print(f"[OUTBOX] Batch {batch_id} failed (attempt {attempts}), retry in {delay}s")
+
+# Xử lý outbox một lượt: gửi lại các batch lỗi, rồi gom entry mới thành batch
+def drain_outbox():
+    now = datetime.utcnow()
+    inflight_until = now + timedelta(seconds=OUTBOX_INFLIGHT_SECONDS)
+
+    # Batch đã gửi nhưng chưa thành công: gửi lại đúng batch_id cũ
+    for batch_id in outbox.distinct("batch_id", {"state": "sending", "next_attempt_at": {"$lte": now}}):
+        claimed = outbox.update_many(
+            {"batch_id": batch_id, "state": "sending", "next_attempt_at": {"$lte": now}},
+            {"$set": {"next_attempt_at": inflight_until}}
+        )
+        if claimed.modified_count:
+            _send_batch(batch_id, list(outbox.find({"batch_id": batch_id, "state": "sending"})))
+
+    # Entry mới: gán batch_id rồi gửi
+    pending = outbox.find(
+        {"state": "pending", "next_attempt_at": {"$lte": now}}, {"_id": 1}
+    ).limit(OUTBOX_BATCH_SIZE)
+    ids = [e["_id"] for e in pending]
+    if not ids:
+        return
+    batch_id = uuid.uuid4().hex
+    outbox.update_many(
+        {"_id": {"$in": ids}, "state": "pending"},
+        {"$set": {"state": "sending", "batch_id": batch_id, "next_attempt_at": inflight_until}}
+    )
+    entries = list(outbox.find({"batch_id": batch_id, "state": "sending"}))
+    if entries:
+        _send_batch(batch_id, entries)
+
+# Phục hồi các phiếu đã đánh dấu cần hoàn kho nhưng chưa kịp ghi outbox
+# (ví dụ process bị tắt giữa hai bước)
+def recover_pending_restocks():
+    cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_INFLIGHT_SECONDS)
+    for borrow in borrows.find({"restock_pending": True, "actual_return_date": {"$lt": cutoff}}):
+        enqueue_restock(borrow)
+
+# Vòng lặp nền xử lý outbox
+def _outbox_loop():
+    while True:
+        try:
+            recover_pending_restocks()
+            drain_outbox()
+        except Exception as e:
+            print(f"[OUTBOX] Drain failed: {e}")
+        time.sleep(OUTBOX_POLL_INTERVAL)
+
+# Khởi động worker hoàn kho chạy nền
+def start_outbox_worker():
+    t = threading.Thread(target=_outbox_loop, name="inventory-outbox", daemon=True)
+    t.start()
+    return t
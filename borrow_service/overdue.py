@@ -0,0 +1,86 @@
+import threading, time
+from datetime import datetime, timedelta
+from models.borrow_model import borrows
+from lease import acquire_lease
+from config import (
+    OVERDUE_SWEEP_INTERVAL, OVERDUE_BUCKET_SECONDS, OVERDUE_BATCH_SIZE, OVERDUE_LEASE_SECONDS
+)
+
+LEASE_NAME = "overdue-sweeper"
+
+# Số liệu của lần quét gần nhất (xem qua /metrics)
+sweep_metrics = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_duration_ms": None,
+    "last_flipped": 0,
+    "last_batch_sizes": [],
+    "total_flipped": 0
+}
+
+# Index để tìm phiếu quá hạn mà không phải quét toàn bộ collection
+def ensure_overdue_indexes():
+    borrows.create_index([("status", 1), ("return_date", 1)])
+
+# Chuyển các phiếu "borrowing" đã quá return_date sang "overdue".
+# Xử lý theo từng khoảng thời gian (bucket) bắt đầu từ phiếu quá hạn cũ nhất,
+# mỗi bucket cập nhật theo batch bằng update_many.
+def sweep_overdue():
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    batch_sizes = []
+
+    while True:
+        oldest = borrows.find_one(
+            {"status": "borrowing", "return_date": {"$lt": now}},
+            {"return_date": 1},
+            sort=[("return_date", 1)]
+        )
+        if not oldest:
+            break
+        bucket_start = oldest["return_date"]
+        bucket_end = min(bucket_start + timedelta(seconds=OVERDUE_BUCKET_SECONDS), now)
+        query = {"status": "borrowing", "return_date": {"$gte": bucket_start, "$lt": bucket_end}}
+
+        while True:
+            ids = [b["_id"] for b in borrows.find(query, {"_id": 1}).limit(OVERDUE_BATCH_SIZE)]
+            if not ids:
+                break
+            result = borrows.update_many(
+                {"_id": {"$in": ids}, "status": "borrowing"},
+                {"$set": {"status": "overdue", "overdue_at": now}}
+            )
+            batch_sizes.append(result.modified_count)
+            if len(ids) < OVERDUE_BATCH_SIZE:
+                break
+
+        # Gia hạn lease giữa các bucket để lượt quét dài không bị replica khác chen vào
+        if not acquire_lease(LEASE_NAME, OVERDUE_LEASE_SECONDS):
+            break
+
+    flipped = sum(batch_sizes)
+    sweep_metrics.update({
+        "runs": sweep_metrics["runs"] + 1,
+        "last_run_at": now.isoformat(),
+        "last_duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "last_flipped": flipped,
+        "last_batch_sizes": batch_sizes,
+        "total_flipped": sweep_metrics["total_flipped"] + flipped
+    })
+    return flipped
+
+# Vòng lặp nền: chỉ replica giữ lease mới quét
+def _sweeper_loop():
+    while True:
+        try:
+            if acquire_lease(LEASE_NAME, OVERDUE_LEASE_SECONDS):
+                sweep_overdue()
+        except Exception as e:
+            print(f"[OVERDUE] Sweep failed: {e}")
+        time.sleep(OVERDUE_SWEEP_INTERVAL)
+
+# Khởi động bộ quét phiếu quá hạn chạy nền
+def start_overdue_sweeper():
+    t = threading.Thread(target=_sweeper_loop, name="overdue-sweeper", daemon=True)
+    t.start()
+    return t
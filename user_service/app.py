@@ -1,43 +1,33 @@
 from flask import Flask, jsonify, request, render_template
-from pymongo import MongoClient
-from service_registry import register_service
+from service_registry import register_service, discovery_check
+import clients
+from gateway import gateway_identity
+from rate_limit import limit_writes, ensure_rate_limit_indexes
+from idempotency import idempotent, ensure_idempotency_indexes
+from health import add_check, mongo_check, start_health_monitor, install_drain_handler, mark_ready, liveness, readiness
 from config import *
-import requests, consul, time, os
-from models.user_model import get_all_users, get_user_by_username, create_user, update_user, delete_user
+from database import client as mongo_client
+from models.user_model import get_all_users, get_user_by_username, create_user, update_user, delete_user, user_projection
 
 app = Flask(__name__)
 app.secret_key = "user_secret"
 
-client = MongoClient(MONGO_URI)
-users_col = client["userdb"]["users"]
-
-# Kiểm tra service có hoạt động không
+# Kiểm tra service có hoạt động không (liveness)
 @app.route("/health")
+@app.route("/health/live")
 def health():
-    return {"status": "UP"}, 200
-
-# Tìm địa chỉ Auth Service từ Consul (thử nhiều lần nếu chưa sẵn sàng)
-def get_auth_service_url(retries=5, delay=2):
-    c = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-    for attempt in range(retries):
-        services = c.agent.services()
-        for s in services.values():
-            if s["Service"] == AUTH_SERVICE_NAME:
-                return f"http://{s['Address']}:{s['Port']}"
-        time.sleep(delay)
-    return os.environ.get("AUTH_FALLBACK_URL", "http://127.0.0.1:5000")
+    body, status = liveness()
+    return jsonify(body), status
+
+# Kiểm tra service đã sẵn sàng nhận request chưa (đọc trạng thái đã cache)
+@app.route("/health/ready")
+def health_ready():
+    body, status = readiness()
+    return jsonify(body), status
 
 # Gọi Auth Service để xác thực token
 def verify_token_with_auth(token):
-    auth_url = get_auth_service_url()
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        r = requests.post(f"{auth_url}/auth/verify", headers=headers, timeout=5)
-        if r.status_code == 200:
-            return r.json()  # {"valid": True, "sub": {...}}
-    except requests.exceptions.RequestException:
-        pass
-    return {"valid": False}
+    return clients.auth_client.verify(token)
 
 # Lấy token từ header Authorization
 def get_token_from_request():
@@ -46,6 +36,14 @@ def get_token_from_request():
         return auth_header.split(" ", 1)[1]
     return auth_header.strip()
 
+# Xác thực request: tin danh tính do API gateway gửi kèm (nếu bật
+# TRUST_GATEWAY_HEADERS và có GATEWAY_SECRET), ngược lại gọi Auth Service như bình thường
+def authenticate_request():
+    identity = gateway_identity()
+    if identity:
+        return {"valid": True, "sub": identity}
+    return verify_token_with_auth(get_token_from_request())
+
 # Hiển thị trang quản lý người dùng
 @app.route("/")
 @app.route("/user")
@@ -54,35 +52,43 @@ def user_shell():
     # Get token from localStorage in frontend
     return render_template("users.html")
 
-# Lấy danh sách người dùng (chỉ admin)
+# Lấy danh sách người dùng (chỉ admin, hỗ trợ ?fields=id,username,...)
 @app.route("/user-api/users", methods=["GET"])
 def api_get_users():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "forbidden"}), 403
-    return jsonify(get_all_users()), 200
+
+    try:
+        projection = user_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(get_all_users(projection)), 200
 
 # Lấy thông tin người dùng theo username (chỉ admin)
 @app.route("/user-api/users/<username>", methods=["GET"])
 def api_get_user(username):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "forbidden"}), 403
 
-    user = get_user_by_username(username)
+    try:
+        projection = user_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user = get_user_by_username(username, projection)
     if user:
         return jsonify(user), 200
     return jsonify({"error": "Không tìm thấy người dùng"}), 404
 
 # Thêm người dùng mới (chỉ admin)
 @app.route("/user-api/users", methods=["POST"])
+@limit_writes()
+@idempotent()
 def api_add_user():
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "forbidden"}), 403
@@ -98,9 +104,10 @@ def api_add_user():
 
 # Cập nhật thông tin người dùng (chỉ admin)
 @app.route("/user-api/users/<username>", methods=["PUT"])
+@limit_writes()
+@idempotent()
 def api_update_user(username):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "forbidden"}), 403
@@ -113,9 +120,10 @@ def api_update_user(username):
 
 # Xóa người dùng (chỉ admin)
 @app.route("/user-api/users/<username>", methods=["DELETE"])
+@limit_writes()
+@idempotent()
 def api_delete_user(username):
-    token = get_token_from_request()
-    verify = verify_token_with_auth(token)
+    verify = authenticate_request()
     role = (verify.get("sub") or {}).get("role")
     if not verify.get("valid") or role != "admin":
         return jsonify({"error": "forbidden"}), 403
@@ -125,7 +133,20 @@ def api_delete_user(username):
         return jsonify({"message": "Đã xóa người dùng"}), 200
     return jsonify({"error": "Không tìm thấy người dùng"}), 404
 
+# Khởi động các tác vụ nền của service
+def start_background_tasks():
+    ensure_rate_limit_indexes()
+    ensure_idempotency_indexes()
+    add_check("mongo", mongo_check(mongo_client))
+    add_check("auth-service", discovery_check(AUTH_SERVICE_NAME))
+    start_health_monitor()
+    install_drain_handler()
+    mark_ready()
+
 # Khởi chạy ứng dụng
 if __name__ == "__main__":
     register_service()
-    app.run(port=SERVICE_PORT, debug=True)
\ No newline at end of file
+    start_background_tasks()
+    # Tắt reloader: process cha của reloader sẽ chạy background task lần thứ hai
+    # và ghi đè handler SIGTERM (bỏ qua bước draining)
+    app.run(host=SERVICE_HOST, port=SERVICE_PORT, debug=True, use_reloader=False)
\ No newline at end of file
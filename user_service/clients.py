@@ -0,0 +1,29 @@
+import requests
+from service_registry import ServiceBalancer, call_service
+from config import AUTH_SERVICE_NAME, AUTH_FALLBACK_URL
+
+# Giao diện gọi sang các service khác. Mặc định gọi qua HTTP (Consul + cân bằng tải);
+# chế độ all-in-one thay bằng bản gọi hàm trực tiếp trong cùng process qua use().
+
+# Xác thực token qua Auth Service
+class HttpAuthClient:
+    def __init__(self):
+        self.balancer = ServiceBalancer(AUTH_SERVICE_NAME, AUTH_FALLBACK_URL)
+
+    def verify(self, token):
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            res = call_service(self.balancer, "POST", "/auth/verify", headers=headers, timeout=5)
+            if res.status_code == 200:
+                return res.json()  # {"valid": True, "sub": {...}}
+            return {"valid": False, "error": "Token không hợp lệ"}
+        except requests.exceptions.RequestException as e:
+            return {"valid": False, "error": f"Không thể xác thực token: {str(e)}"}
+
+auth_client = HttpAuthClient()
+
+# Thay client mặc định (dùng cho chế độ all-in-one)
+def use(auth=None):
+    global auth_client
+    if auth:
+        auth_client = auth
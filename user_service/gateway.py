@@ -0,0 +1,15 @@
+import hmac
+from flask import request
+from config import TRUST_GATEWAY_HEADERS, GATEWAY_SECRET
+
+# Danh tính do API gateway gắn vào request (header X-Auth-User / X-Auth-Role).
+# Chỉ tin khi bật TRUST_GATEWAY_HEADERS, đã cấu hình GATEWAY_SECRET và request
+# mang đúng secret đó; secret rỗng thì ai gọi thẳng vào service cũng giả được.
+def gateway_identity():
+    if not TRUST_GATEWAY_HEADERS or not GATEWAY_SECRET:
+        return None
+    username = request.headers.get("X-Auth-User")
+    secret = request.headers.get("X-Gateway-Secret", "")
+    if not username or not hmac.compare_digest(secret, GATEWAY_SECRET):
+        return None
+    return {"username": username, "role": request.headers.get("X-Auth-Role", "user")}
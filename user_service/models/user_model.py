@@ -1,13 +1,18 @@
-from pymongo import MongoClient
 from datetime import datetime
-from config import MONGO_URI
+from database import db, for_reads, build_projection
 import bcrypt
 
 # Kết nối MongoDB
-client = MongoClient(MONGO_URI)
-db = client["userdb"]
 collection = db["users"]
 
+# Các trường được phép trả về qua API (không có password, token)
+USER_FIELDS = ("id", "name", "username", "age", "address", "role", "created_at", "updated_at")
+
+# Projection cho tham số fields= của API người dùng
+def user_projection(fields=None):
+    """Tạo projection theo danh sách trường được phép"""
+    return build_projection(fields, USER_FIELDS, USER_FIELDS)
+
 # ---------------------- HỖ TRỢ HASH MẬT KHẨU ----------------------
 
 # Mã hóa mật khẩu thành chuỗi hash để lưu vào database
@@ -19,15 +24,15 @@ def hash_password(password: str) -> str:
 # ---------------------- CRUD NGƯỜI DÙNG ----------------------
 
 # Lấy danh sách tất cả người dùng
-def get_all_users():
+def get_all_users(projection=None):
     """Lấy toàn bộ người dùng"""
-    users = list(collection.find({}, {"_id": 0}))
+    users = list(for_reads(collection).find({}, projection or user_projection()))
     return users
 
 # Lấy thông tin người dùng theo username
-def get_user_by_username(username):
+def get_user_by_username(username, projection=None):
     """Lấy thông tin người dùng theo username"""
-    user = collection.find_one({"username": username}, {"_id": 0})
+    user = collection.find_one({"username": username}, projection or user_projection())
     return user
 
 # Tạo người dùng mới (tự động hash mật khẩu)
@@ -0,0 +1,183 @@
+import threading, time, math, hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, g
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import db
+from config import (
+    RATE_LIMIT_BACKEND, RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_IDENTITY_RATE, RATE_LIMIT_IDENTITY_BURST, TRUST_X_REAL_IP,
+    MAX_CONCURRENT_REQUESTS, MAX_QUEUE_DEPTH, QUEUE_TIMEOUT_SECONDS, SHED_RETRY_AFTER_SECONDS
+)
+
+# ---------------------- TOKEN BUCKET ----------------------
+
+# Lưu bucket trong bộ nhớ process (mặc định, mỗi replica giới hạn riêng)
+class MemoryBucketStore:
+    def __init__(self, prune_interval=10):
+        self._buckets = {}  # key -> (tokens, ts, thời điểm bucket đầy lại)
+        self._lock = threading.Lock()
+        self._prune_interval = prune_interval
+        self._next_prune = time.monotonic() + prune_interval
+
+    # Lấy một token; trả về số giây cần chờ (0 nếu được phép)
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - ts) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if now >= self._next_prune:
+                self._prune(now)
+                self._next_prune = now + self._prune_interval
+        return retry_after
+
+    # Bỏ các bucket đã đầy lại (không còn cần nhớ), theo thời điểm lưu cùng
+    # từng bucket vì bucket IP và bucket danh tính có rate/burst khác nhau
+    def _prune(self, now):
+        self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+
+# Lưu bucket trong MongoDB để nhiều replica dùng chung giới hạn
+class MongoBucketStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        refill = {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$ts", now]}]}]}, rate]}
+        pipeline = [
+            {"$set": {
+                "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, refill]}]},
+                "ts": now
+            }},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": datetime.utcnow() + timedelta(seconds=burst / rate + 60)
+            }}
+        ]
+        try:
+            doc = self.collection.find_one_and_update(
+                {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Hai request cùng tạo bucket mới: thử lại, lần này document đã tồn tại
+            doc = self.collection.find_one_and_update(
+                {"_id": key}, pipeline, return_document=ReturnDocument.AFTER
+            )
+        if doc["allowed"]:
+            return 0
+        return (1 - doc["tokens"]) / rate
+
+rate_limits = db["rate_limits"]
+_store = MongoBucketStore(rate_limits) if RATE_LIMIT_BACKEND == "mongo" else MemoryBucketStore()
+
+# Tạo TTL index cho bucket lưu trong MongoDB (gọi khi service khởi động)
+def ensure_rate_limit_indexes():
+    if RATE_LIMIT_BACKEND == "mongo":
+        rate_limits.create_index("expires_at", expireAfterSeconds=0)
+
+# ---------------------- GIỚI HẠN ĐỒNG THỜI ----------------------
+
+# Giới hạn số request ghi xử lý cùng lúc; khi hàng chờ quá dài thì từ chối ngay
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent, max_queue, timeout):
+        self._sem = threading.BoundedSemaphore(max_concurrent)
+        self._max_queue = max_queue
+        self._timeout = timeout
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self._sem.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self._waiting >= self._max_queue:
+                return False
+            self._waiting += 1
+        try:
+            return self._sem.acquire(timeout=self._timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self):
+        self._sem.release()
+
+_limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, MAX_QUEUE_DEPTH, QUEUE_TIMEOUT_SECONDS)
+
+# ---------------------- DECORATOR ----------------------
+
+# IP của client (lấy từ X-Real-IP do gateway gắn nếu được cấu hình tin tưởng)
+def client_ip():
+    if TRUST_X_REAL_IP and request.headers.get("X-Real-IP"):
+        return request.headers["X-Real-IP"]
+    return request.remote_addr or "unknown"
+
+# Danh tính mặc định: hash của token trong header Authorization
+def token_identity():
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header:
+        return None
+    return hashlib.sha256(auth_header.encode("utf-8")).hexdigest()[:32]
+
+def _reject(status, retry_after, message):
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+# Shed request khi không còn slot xử lý
+def shed_response():
+    return _reject(503, SHED_RETRY_AFTER_SECONDS, "Hệ thống đang quá tải, vui lòng thử lại sau")
+
+# Tạm trả slot đồng thời của request hiện tại khi nó chỉ ngồi chờ (ví dụ chờ
+# request trùng Idempotency-Key xử lý xong), để không chặn các request ghi khác.
+# Trả về True nếu request đang giữ slot và đã trả.
+def release_write_slot():
+    if not g.get("write_slot"):
+        return False
+    g.write_slot = False
+    _limiter.release()
+    return True
+
+# Lấy lại slot trước khi thực sự xử lý; False nếu hệ thống đang quá tải
+def reacquire_write_slot():
+    if not _limiter.acquire():
+        return False
+    g.write_slot = True
+    return True
+
+# Áp dụng giới hạn theo IP, theo danh tính và giới hạn đồng thời cho endpoint ghi.
+# identity: hàm trả về khóa danh tính (mặc định dùng token của request).
+def limit_writes(identity=token_identity):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method in ("GET", "HEAD", "OPTIONS"):
+                return fn(*args, **kwargs)
+
+            retry_after = _store.take(f"ip:{client_ip()}", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST)
+            if not retry_after:
+                key = identity()
+                if key:
+                    retry_after = _store.take(f"id:{key}", RATE_LIMIT_IDENTITY_RATE, RATE_LIMIT_IDENTITY_BURST)
+            if retry_after:
+                return _reject(429, retry_after, "Quá nhiều yêu cầu, vui lòng thử lại sau")
+
+            if not _limiter.acquire():
+                return shed_response()
+            g.write_slot = True
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if g.pop("write_slot", False):
+                    _limiter.release()
+        return wrapper
+    return decorator